@@ -7,6 +7,7 @@ AI模型管理器
 
 import asyncio
 import json
+import os
 import time
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
@@ -16,6 +17,16 @@ from dataclasses import dataclass
 from enum import Enum
 import hashlib
 
+import aiofiles
+
+
+def default_mock_delay() -> float:
+    """模拟模型的默认处理耗时（秒）：环境变量MOCK_AI_DELAY优先，pytest运行时不等待，否则2秒"""
+    env_delay = os.getenv('MOCK_AI_DELAY')
+    if env_delay is not None:
+        return float(env_delay)
+    return 0 if os.getenv('PYTEST_CURRENT_TEST') else 2
+
 
 class ModelType(Enum):
     """AI模型类型"""
@@ -33,6 +44,7 @@ class TaskType(Enum):
     TEXT_GENERATION = "text_generation"         # 文本生成
     IMAGE_GENERATION = "image_generation"       # 图片生成
     COMPARISON_CREATION = "comparison_creation" # 对比图创建
+    STRUCTURED_MULTI = "structured_multi"       # 一次调用输出分析、方案、回复的结构化JSON
 
 
 @dataclass
@@ -47,6 +59,7 @@ class ModelCapability:
     cost_per_request: float = 0.0
     requests_per_hour: int = 1000
     supports_batch: bool = False
+    returns_json: bool = False  # 能按要求只输出JSON对象，决定是否使用一次调用的结构化输出
 
 
 @dataclass
@@ -124,7 +137,10 @@ class BaseAIModel(ABC):
             TaskType.IMAGE_ANALYSIS: self.config.capabilities.can_analyze_images,
             TaskType.TEXT_GENERATION: self.config.capabilities.can_generate_text,
             TaskType.IMAGE_GENERATION: self.config.capabilities.can_generate_images,
-            TaskType.COMPARISON_CREATION: self.config.capabilities.can_create_comparisons
+            TaskType.COMPARISON_CREATION: self.config.capabilities.can_create_comparisons,
+            TaskType.STRUCTURED_MULTI: (self.config.capabilities.can_analyze_images and
+                                        self.config.capabilities.can_generate_text and
+                                        self.config.capabilities.returns_json)
         }
         
         return capability_map.get(task_type, False)
@@ -157,9 +173,9 @@ class BaseAIModel(ABC):
 class MockAIModel(BaseAIModel):
     """模拟AI模型 - 用于开发测试"""
     
-    def __init__(self, config: ModelConfig):
+    def __init__(self, config: ModelConfig, mock_delay: float = None):
         super().__init__(config)
-        self.mock_delay = 2
+        self.mock_delay = mock_delay if mock_delay is not None else default_mock_delay()
         
         # 设置默认能力
         if not config.capabilities:
@@ -168,7 +184,8 @@ class MockAIModel(BaseAIModel):
                 can_generate_text=True,
                 can_generate_images=True,
                 can_create_comparisons=True,
-                cost_per_request=0.05
+                cost_per_request=0.05,
+                returns_json=True
             )
     
     async def process_task(self, request: TaskRequest) -> TaskResult:
@@ -177,7 +194,8 @@ class MockAIModel(BaseAIModel):
         
         try:
             # 模拟处理时间
-            await asyncio.sleep(self.mock_delay)
+            if self.mock_delay:
+                await asyncio.sleep(self.mock_delay)
             
             if request.task_type == TaskType.IMAGE_ANALYSIS:
                 result = self._mock_image_analysis(request)
@@ -187,6 +205,8 @@ class MockAIModel(BaseAIModel):
                 result = self._mock_image_generation(request)
             elif request.task_type == TaskType.COMPARISON_CREATION:
                 result = self._mock_comparison_creation(request)
+            elif request.task_type == TaskType.STRUCTURED_MULTI:
+                result = self._mock_structured_multi(request)
             else:
                 raise ValueError(f"不支持的任务类型: {request.task_type}")
             
@@ -292,6 +312,28 @@ class MockAIModel(BaseAIModel):
             "quality": "high"
         }
     
+    def _mock_structured_multi(self, request: TaskRequest) -> Dict:
+        """模拟结构化多任务输出：与真实模型一样，以JSON文本形式返回"""
+        structured = {
+            "analysis": self._mock_image_analysis(request)["analysis"],
+            "plans": self._mock_text_generation(request)["generated_text"],
+            "replies": """
+## 版本1：详细专业版
+看了你的需求，这个空间很有改造潜力！建议优先优化收纳和色彩搭配，预算内就能有明显变化～
+
+## 版本2：简洁实用版
+空间基础不错，重点做收纳和软装，预算2万左右就能搞定！
+
+## 版本3：互动引导版
+你更喜欢哪种风格呢？告诉我你的偏好，我再帮你细化方案哦～
+            """
+        }
+        return {
+            "generated_text": json.dumps(structured, ensure_ascii=False),
+            "word_count": 400,
+            "style": "专业友好"
+        }
+    
     def _mock_comparison_creation(self, request: TaskRequest) -> Dict:
         """模拟对比图创建"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -514,7 +556,8 @@ class AIModelManager:
                     can_generate_text=True,
                     can_generate_images=True,
                     can_create_comparisons=True,
-                    cost_per_request=0.05
+                    cost_per_request=0.05,
+                    returns_json=True
                 ),
                 priority=2,
                 enabled=True
@@ -627,8 +670,9 @@ class AIModelManager:
         }
         
         history_file = self.history_path / f"task_{request.task_id}.json"
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history_record, f, ensure_ascii=False, indent=2)
+        # 并行生成多张效果图时每次调用都会写历史，异步写入不阻塞其他请求
+        async with aiofiles.open(history_file, 'w', encoding='utf-8') as f:
+            await f.write(json.dumps(history_record, ensure_ascii=False, indent=2))
     
     def get_model_statistics(self) -> Dict:
         """获取模型统计信息"""
@@ -15,7 +15,7 @@ import re
 import pandas as pd
 import asyncio
 
-from dynamic_comment_extractor import DynamicCommentExtractor
+from dynamic_comment_extractor import DynamicCommentExtractor, queue_logging
 from local_comment_loader import LocalCommentLoader
 from intelligent_reply_generator import create_intelligent_reply_generator
 from comment_selector import CommentSelector, SelectionCriteria, CommentPriority
@@ -289,7 +289,7 @@ def run_extraction_simple(urls: list, cookie: str, work_path: str, max_comments:
         
         # 创建一个新的事件循环用于异步操作
         async def async_extraction():
-            extractor = DynamicCommentExtractor(
+            extractor = await DynamicCommentExtractor.create(
                 work_path=work_path,
                 cookie=cookie,
                 use_persistent_session=True,
@@ -301,43 +301,45 @@ def run_extraction_simple(urls: list, cookie: str, work_path: str, max_comments:
             total_urls = len(urls)
             results = []
             
-            for i, url in enumerate(urls):
-                note_id = extract_note_id_simple(url)
-                current_task = f"处理作品 {i+1}/{total_urls}: {note_id}"
-                
-                # 更新进度
-                progress = (i / total_urls) * 100
-                st.session_state.extraction_progress = progress
-                st.session_state.current_task = current_task
-                add_log(f"开始{current_task}")
-                
-                try:
-                    success = await extractor.extract_comments(url)
+            # 所有作品共用一个浏览器实例；无论正常结束、出错还是被取消，退出时都会关闭浏览器
+            async with extractor:
+                for i, url in enumerate(urls):
+                    note_id = extract_note_id_simple(url)
+                    current_task = f"处理作品 {i+1}/{total_urls}: {note_id}"
                     
-                    if success:
-                        add_log(f"✅ 作品 {note_id} 处理成功", "success")
-                        results.append({
-                            'url': url,
-                            'note_id': note_id,
-                            'status': 'success',
-                            'message': '处理成功'
-                        })
-                    else:
-                        add_log(f"❌ 作品 {note_id} 处理失败", "error")
+                    # 更新进度
+                    progress = (i / total_urls) * 100
+                    st.session_state.extraction_progress = progress
+                    st.session_state.current_task = current_task
+                    add_log(f"开始{current_task}")
+                    
+                    try:
+                        success = await extractor.extract_comments(url)
+                        
+                        if success:
+                            add_log(f"✅ 作品 {note_id} 处理成功", "success")
+                            results.append({
+                                'url': url,
+                                'note_id': note_id,
+                                'status': 'success',
+                                'message': '处理成功'
+                            })
+                        else:
+                            add_log(f"❌ 作品 {note_id} 处理失败", "error")
+                            results.append({
+                                'url': url,
+                                'note_id': note_id,
+                                'status': 'failed',
+                                'message': '处理失败'
+                            })
+                    except Exception as e:
+                        add_log(f"❌ 作品 {note_id} 发生异常: {str(e)}", "error")
                         results.append({
                             'url': url,
                             'note_id': note_id,
-                            'status': 'failed',
-                            'message': '处理失败'
+                            'status': 'error',
+                            'message': f'异常: {str(e)}'
                         })
-                except Exception as e:
-                    add_log(f"❌ 作品 {note_id} 发生异常: {str(e)}", "error")
-                    results.append({
-                        'url': url,
-                        'note_id': note_id,
-                        'status': 'error',
-                        'message': f'异常: {str(e)}'
-                    })
             
             # 完成处理
             st.session_state.extraction_progress = 100
@@ -348,11 +350,12 @@ def run_extraction_simple(urls: list, cookie: str, work_path: str, max_comments:
             success_count = len([r for r in results if r['status'] == 'success'])
             add_log(f"🎉 所有作品处理完成！成功: {success_count}/{total_urls}", "success")
         
-        # 直接运行异步任务
+        # 直接运行异步任务；逐条评论的失败信息通过logging输出到控制台
         try:
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
-            loop.run_until_complete(async_extraction())
+            with queue_logging():
+                loop.run_until_complete(async_extraction())
         finally:
             loop.close()
             
@@ -1769,7 +1772,7 @@ def main():
             st.dataframe(history_df, use_container_width=True)
         
         # 显示处理历史
-        processing_history = reply_generator.get_processing_history(history_limit)
+        processing_history = run_async_function(reply_generator.get_processing_history, history_limit)
         if processing_history:
             st.write("**🤖 处理历史**")
             processing_df = pd.DataFrame(processing_history)
@@ -104,8 +104,9 @@ class CookieManager:
         self.cookie_file = self.work_path / "cookie_cache.json"
         self.browser_profile = self.work_path / "browser_profile"
         
-        # 确保目录存在
-        self.work_path.mkdir(exist_ok=True)
+        # 确保目录存在（目录已存在时只做一次stat，避免重复mkdir）
+        if not self.work_path.exists():
+            self.work_path.mkdir(parents=True, exist_ok=True)
         
         # Cookie缓存
         self._cached_cookie = None
@@ -3,16 +3,26 @@
 """
 小红书动态评论提取器
 使用浏览器自动化获取动态加载的评论数据
+
+可选依赖：orjson（JSON编解码）、ciso8601（ISO时间解析）、uvloop（非Windows下直接运行时的事件循环）
 """
 
 import asyncio
 import json
+import logging
+import logging.handlers
+import os
+import queue
 import re
 import time
+from collections import deque
+from itertools import islice
+from operator import itemgetter
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional
-from urllib.parse import urlparse
 import mimetypes
 
 import aiofiles
@@ -22,14 +32,609 @@ from rich.console import Console
 from rich.progress import Progress, TextColumn, BarColumn, TimeRemainingColumn
 
 from cookie_manager import CookieManager
+from json_utils import HAS_ORJSON, dump_json_bytes, load_json_bytes
+
+try:
+    from ciso8601 import parse_datetime as parse_iso_datetime
+except ImportError:  # ciso8601为可选依赖，缺失时回退到datetime.fromisoformat
+    def parse_iso_datetime(value: str) -> datetime:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def without_raw_data(comment: Dict) -> Dict:
+    """去掉调试用的raw_data字段；没有该字段时直接返回原对象，不复制"""
+    if 'raw_data' not in comment:
+        return comment
+    return {k: v for k, v in comment.items() if k != 'raw_data'}
+
+
+@lru_cache(maxsize=4096)
+def format_timestamp(timestamp) -> str:
+    """格式化秒/毫秒时间戳；同一秒发布的评论很多，结果按时间戳缓存"""
+    if timestamp > 10**12:  # 毫秒级
+        dt = datetime.fromtimestamp(timestamp / 1000)
+    else:  # 秒级
+        dt = datetime.fromtimestamp(timestamp)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+# 当前时间字符串缓存：[整秒时间戳, 格式化结果]
+_NOW_STR_CACHE = [0, '']
+
+
+def now_str() -> str:
+    """当前时间的'%Y-%m-%d %H:%M:%S'字符串，同一秒内复用上次的格式化结果"""
+    t = int(time.time())
+    if _NOW_STR_CACHE[0] != t:
+        _NOW_STR_CACHE[1] = datetime.fromtimestamp(t).strftime("%Y-%m-%d %H:%M:%S")
+        _NOW_STR_CACHE[0] = t
+    return _NOW_STR_CACHE[1]
+
+
+@lru_cache(maxsize=4096)
+def iso_to_millis(time_str: str) -> int:
+    """ISO-8601时间转毫秒时间戳，结果与当前时间无关，可以缓存"""
+    return int(parse_iso_datetime(time_str).timestamp() * 1000)
+
+
+@lru_cache(maxsize=4096)
+def _clean_filename(filename: str) -> str:
+    """清理文件名中的非法字符；评论作者经常重复，按昵称缓存结果"""
+    # 替换非法字符
+    filename = filename.translate(_ILLEGAL_FILENAME_TABLE)
+    
+    # 替换多个连续的空格和下划线为单个下划线
+    filename = _FILENAME_SEP_RE.sub('_', filename)
+    
+    # 移除开头和结尾的下划线和空格
+    filename = filename.strip('_').strip()
+    
+    # 如果文件名太长，智能截取（保留前面的重要信息）
+    if len(filename) > 80:  # 增加长度限制，更好地保留标题信息
+        filename = filename[:80].rstrip('_')
+    
+    # 如果清理后为空，返回默认名称
+    if not filename:
+        filename = "未命名作品"
+        
+    return filename
+
+
+# 逐条评论/逐张图片的过程信息和失败信息走logging，控制台只输出每篇笔记的汇总
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def queue_logging(level: int = logging.INFO):
+    """在with块内把本模块日志先放入队列，由后台线程输出到控制台，热路径上的日志不会阻塞事件循环
+    
+    命令行入口和Streamlit界面都应在运行提取时使用；退出时输出剩余日志并恢复原有配置。
+    """
+    log_queue = queue.SimpleQueue()
+    try:
+        from rich.logging import RichHandler
+        target = RichHandler(show_path=False)
+    except ImportError:
+        target = logging.StreamHandler()
+    
+    handler = logging.handlers.QueueHandler(log_queue)
+    listener = logging.handlers.QueueListener(log_queue, target)
+    old_level, old_propagate = logger.level, logger.propagate
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    listener.start()
+    try:
+        yield
+    finally:
+        listener.stop()
+        logger.removeHandler(handler)
+        logger.setLevel(old_level)
+        logger.propagate = old_propagate
 
 # from source import XHS  # 注释掉原有依赖，使评论提取器独立运行
 
+def write_json_file(path: Path, data, indent: bool = False) -> None:
+    """同步写入JSON文件；无orjson时用json.dump边编码边写，不在内存中拼出完整字符串"""
+    if HAS_ORJSON:
+        path.write_bytes(dump_json_bytes(data, indent))
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2 if indent else None)
+
+
+def write_comment_files(text_file: Path, text: str, json_file: Path, data) -> None:
+    """同步写入一条评论的文本和JSON文件，两个文件只占用一次线程切换"""
+    text_file.write_text(text, encoding='utf-8')
+    write_json_file(json_file, data, True)
+
+
+_MISSING = object()
+
+
+def _first_present(data: Dict, aliases, default=None):
+    """按别名顺序取第一个存在的字段，等价于链式get但不会提前构造默认值"""
+    for key in aliases:
+        value = data.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+    return default
+
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36'
+
+# Playwright Cookie的固定字段
+COOKIE_BASE = {'domain': '.xiaohongshu.com', 'path': '/'}
+
+# 评论提取不需要大尺寸窗口，缩小视口以减少绘制开销
+VIEWPORT = {'width': 800, 'height': 600}
+
+# 浏览器启动参数
+BROWSER_ARGS = [
+    '--disable-gpu',
+    '--disable-software-rasterizer',
+    '--disable-blink-features=AutomationControlled',
+    '--disable-dev-shm-usage',
+    '--no-sandbox',
+    '--disable-extensions',
+    '--disable-plugins',
+    '--disable-web-security',
+    '--disable-features=VizDisplayCompositor',
+    '--disable-background-timer-throttling',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-renderer-backgrounding',
+    '--no-first-run',
+    '--disable-default-apps'
+]
+
+# 笔记信息缓存有效期（秒），笔记标题基本不会变化
+NOTE_CACHE_TTL = 7 * 86400
+
+# 只读取noteDetailMap中新增的评论，避免整个__INITIAL_STATE__跨CDP序列化
+COMMENTS_DELTA_JS = """
+    (arg) => {
+        const m = window.__INITIAL_STATE__?.note?.noteDetailMap?.[arg.id]?.comments;
+        if (!m) {
+            return null;
+        }
+        return {list: (m.list || []).slice(arg.seen), hasMore: m.hasMore, loading: m.loading};
+    }
+"""
+
+# 第一页只取评论和userMap两个子树，不把整个页面状态序列化传回Python
+STATE_SUBSET_JS = """
+    (noteId) => {
+        const state = window.__INITIAL_STATE__;
+        const comments = state?.note?.noteDetailMap?.[noteId]?.comments;
+        if (!comments) {
+            return null;
+        }
+        return {
+            note: {noteDetailMap: {[noteId]: {comments: comments}}},
+            user: {userMap: state.user?.userMap || {}}
+        };
+    }
+"""
+
+# 完整页面状态，仅在调试或评论子树为空需要全量搜索时读取；
+# 在页面内序列化成JSON字符串再传回，跳过CDP逐个对象的序列化；
+# 只丢弃真正的循环引用（值是当前路径上的祖先），多处共享的对象（如userMap中的用户）照常保留
+FULL_STATE_JS = """
+    () => {
+        const state = window.__INITIAL_STATE__;
+        if (!state) {
+            return null;
+        }
+        const ancestors = [];
+        return JSON.stringify(state, function (key, value) {
+            if (value === null || typeof value !== 'object') {
+                return value;
+            }
+            // this是当前值的父对象，弹出已经离开的分支
+            while (ancestors.length > 0 && ancestors[ancestors.length - 1] !== this) {
+                ancestors.pop();
+            }
+            if (ancestors.includes(value)) {
+                return undefined;
+            }
+            ancestors.push(value);
+            return value;
+        });
+    }
+"""
+
+# 笔记链接中的笔记ID，按优先级依次匹配
+NOTE_ID_PATTERNS = tuple(re.compile(pattern) for pattern in (
+    r'explore/([a-fA-F0-9]+)',
+    r'discovery/item/([a-fA-F0-9]+)',
+    r'item/([a-fA-F0-9]+)'
+))
+
+# 页面状态中的评论列表变长或不再有更多评论时返回true
+COMMENTS_GROWN_JS = """
+    (arg) => {
+        const m = window.__INITIAL_STATE__?.note?.noteDetailMap?.[arg.id]?.comments;
+        return !m || (m.list || []).length > arg.seen || !m.hasMore;
+    }
+"""
+
+# 登录完成判断：出现用户元素，或登录按钮（含“登录”文字的元素）已消失
+LOGIN_DONE_JS = """
+    (arg) => {
+        const exists = (s) => {
+            try {
+                return !!document.querySelector(s);
+            } catch (e) {
+                return false;
+            }
+        };
+        if (arg.userSelectors.some(exists)) {
+            return true;
+        }
+        if (arg.loginSelectors.some(exists)) {
+            return false;
+        }
+        const candidates = document.querySelectorAll('button, a, span, div');
+        for (const el of candidates) {
+            if (el.children.length === 0 && arg.loginTexts.includes(el.textContent.trim())) {
+                return false;
+            }
+        }
+        return true;
+    }
+"""
+
+# 页面已渲染出任一目标元素（选择器命中，或存在文字恰好为给定文本的叶子元素），
+# 或页面状态中已有笔记详情时返回true
+ELEMENTS_READY_JS = """
+    (arg) => {
+        if (arg.noteState && Object.keys(window.__INITIAL_STATE__?.note?.noteDetailMap || {}).length) {
+            return true;
+        }
+        const exists = (s) => {
+            try {
+                return !!document.querySelector(s);
+            } catch (e) {
+                return false;
+            }
+        };
+        if (arg.selectors.some(exists)) {
+            return true;
+        }
+        if (!arg.texts.length) {
+            return false;
+        }
+        const candidates = document.querySelectorAll('button, a, span, div');
+        for (const el of candidates) {
+            if (el.children.length === 0 && arg.texts.includes(el.textContent.trim())) {
+                return true;
+            }
+        }
+        return false;
+    }
+"""
+
+# 等待笔记标题或登录相关元素渲染的最长时间（毫秒），超时后按当前页面继续
+TITLE_READY_TIMEOUT = 5000
+LOGIN_READY_TIMEOUT = 5000
+
+# 标题提取用到的特定选择器
+TITLE_SELECTORS = [
+    '[data-v-*] .title',
+    '.note-content .title',
+    '.note-detail .title',
+    '.content .title',
+    '.note-scroller .title'
+]
+
+# 一次取回所有标题候选：页面标题、og:title、h1、noteDetailMap及各选择器文本
+TITLE_CANDIDATES_JS = """
+    (selectors) => {
+        const text = (s) => {
+            try {
+                const el = document.querySelector(s);
+                return el ? el.textContent : null;
+            } catch (e) {
+                return null;
+            }
+        };
+        const meta = document.querySelector('meta[property="og:title"]');
+        return {
+            title: document.title,
+            meta: meta ? meta.getAttribute('content') : null,
+            h1: text('h1'),
+            state: window.__INITIAL_STATE__?.note?.noteDetailMap || null,
+            texts: selectors.map(text)
+        };
+    }
+"""
+
+# 按顺序查找“加载更多”按钮并点击，返回命中的选择器；找不到时滚动到评论区底部
+LOAD_MORE_JS = """
+    (selectors) => {
+        const find = (s) => {
+            if (s.startsWith('text=')) {
+                const text = s.slice(5).toLowerCase();
+                for (const el of document.querySelectorAll('button, a, span, div')) {
+                    if (el.children.length === 0 && el.textContent.toLowerCase().includes(text)) {
+                        return el;
+                    }
+                }
+                return null;
+            }
+            try {
+                return document.querySelector(s);
+            } catch (e) {
+                return null;
+            }
+        };
+        
+        let clicked = null;
+        for (const s of selectors) {
+            const el = find(s);
+            if (el) {
+                el.click();
+                clicked = s;
+                break;
+            }
+        }
+        
+        if (!clicked) {
+            const containers = document.querySelectorAll('.comments-el, [class*="comment"]');
+            if (containers.length > 0) {
+                containers[containers.length - 1].scrollIntoView({ behavior: 'smooth' });
+            } else {
+                window.scrollTo({ top: document.body.scrollHeight, behavior: 'smooth' });
+            }
+        }
+        
+        window.dispatchEvent(new Event('scroll'));
+        return clicked;
+    }
+"""
+
+# 滚动到第一个匹配的元素，返回命中的选择器
+SCROLL_TO_FIRST_JS = """
+    (selectors) => {
+        for (const s of selectors) {
+            try {
+                const el = document.querySelector(s);
+                if (el) {
+                    el.scrollIntoView({block: 'center'});
+                    return s;
+                }
+            } catch (e) {}
+        }
+        return null;
+    }
+"""
+
+# 小红书评论分页接口，例如 /api/sns/web/v2/comment/page
+COMMENT_API_PATTERN = re.compile(r'/api/sns/web/v\d+/comment/page')
+
+# 等待评论接口响应的超时时间（秒）
+COMMENT_RESPONSE_TIMEOUT = 8
+
+# noteDetailMap中需要忽略的通用标题
+STATE_INVALID_TITLES = frozenset({"小红书", "你的生活兴趣社区"})
+
+# 评论提取用不到的资源类型，直接拦截以减少网络传输
+BLOCKED_RESOURCE_TYPES = frozenset({'image', 'media', 'font', 'stylesheet'})
+
+# 原始评论字段别名表: (标准字段名, 候选字段名, 默认值)
+# 页面状态中是驼峰命名（createTime），评论接口中是下划线命名（create_time）
+RAW_COMMENT_FIELDS = (
+    ('id', ('id',), ''),
+    ('content', ('content',), ''),
+    ('create_time', ('createTime', 'create_time'), 0),
+    ('images', ('pictures', 'images', 'pics'), None),
+    ('ip_location', ('ipLocation', 'ip_location'), ''),
+    ('like_count', ('likeCount', 'like_count'), '0'),
+    ('sub_comment_count', ('subCommentCount', 'sub_comment_count'), '0'),
+)
+
+# 标准化评论字段别名表，兼容接口、页面状态和DOM提取的不同字段名
+NORMALIZED_COMMENT_FIELDS = (
+    ('user_info', ('user_info', 'user', 'author'), _MISSING),
+    ('content', ('content', 'text', 'body'), ''),
+    ('create_time', ('create_time', 'time', 'timestamp'), 0),
+    ('images', ('images', 'pics', 'pictures'), None),
+    ('id', ('id', 'comment_id'), _MISSING),
+)
+
+# 相对时间（"3小时前"）中的数字
+_DIGITS_RE = re.compile(r'(\d+)')
+
+# 文件名中的非法字符映射表，以及需要合并的连续空白/下划线
+_ILLEGAL_FILENAME_TABLE = str.maketrans(dict.fromkeys('<>:"/\\|?*！~' + ''.join(map(chr, range(32))), '_'))
+_FILENAME_SEP_RE = re.compile(r'[_\s]+')
+
+# 评论图片下载：请求头、单个提取器的并发下载数、连接池上限和空闲连接保活时间（秒）
+IMAGE_HEADERS = {'User-Agent': USER_AGENT, 'Referer': 'https://www.xiaohongshu.com/'}
+IMAGE_DOWNLOAD_CONCURRENCY = 16
+IMAGE_CONNECTION_LIMIT = 32
+IMAGE_CONNECTION_LIMIT_PER_HOST = 16
+IMAGE_KEEPALIVE_TIMEOUT = 60
+
+# 可直接沿用URL后缀的图片扩展名
+IMAGE_EXTENSIONS = frozenset({'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp'})
+
+# 评论图片对象中可能的URL字段，按优先级排列
+IMAGE_URL_KEYS = ('url_default', 'url', 'src', 'urlDefault')
+
+# 保存评论时同时处理的用户目录数
+SAVE_BATCH_SIZE = 32
+
+# 兜底的全状态评论搜索最多收集的条数，未设置max_comments时生效
+RECURSIVE_SEARCH_LIMIT = 500
+
+# 未提取到真实评论时使用的演示评论（create_time在使用时填入）
+DEMO_COMMENT = {
+    'user_info': {'nickname': '评论提取演示'},
+    'content': '这是一个演示评论，说明程序结构和功能正常工作。真实评论可能需要登录状态或特定条件才能获取。',
+    'images': [],
+    'id': 'demo_1'
+}
+
+# 提取报告模板
+REPORT_TEMPLATE = """小红书动态评论提取报告
+
+笔记ID: {note_id}
+笔记链接: {note_url}
+作品标题: {work_title}
+提取时间: {extract_time}
+评论数量: {comment_count} 条
+排序方式: 按时间倒序（最新评论在前）
+
+技术方法:
+- 使用Playwright浏览器自动化
+- 模拟真实浏览器访问
+- 动态触发JavaScript评论加载
+- 从__INITIAL_STATE__和DOM中提取数据
+- 按时间排序避免重复下载
+
+说明:
+此版本使用浏览器自动化技术，可以处理动态加载的评论。
+评论按时间倒序排列，最新的评论在前面，避免重复下载。
+如果未获取到真实评论，可能需要登录状态或该笔记暂无评论。
+"""
+
+# 遍历 __INITIAL_STATE__ 时优先识别的容器键
+USER_CONTAINER_KEYS = frozenset({'user', 'users', 'userMap', 'userInfo', 'author'})
+COMMENT_CONTAINER_KEYS = frozenset({'comments', 'comment', 'commentList', 'replies', 'list'})
+
+# 用户数据中可能的ID字段
+USER_ID_KEYS = ('userId', 'user_id', 'uid', 'id')
+
+# 命中其中至少2个字段即视为用户/评论数据
+USER_INDICATOR_KEYS = frozenset({
+    'nickname', 'name', 'username',  # 用户名
+    'avatar', 'avatarUrl',  # 头像
+    'user_id', 'userId', 'uid', 'id'  # 用户ID
+})
+COMMENT_INDICATOR_KEYS = frozenset({
+    'content', 'text', 'body',  # 评论内容
+    'user', 'author', 'user_info',  # 用户信息
+    'create_time', 'time', 'timestamp', 'created_at',  # 时间
+    'id', 'comment_id', 'cid'  # ID
+})
+
+
+class _PagePool:
+    """共享浏览器上下文上的标签页池，按需创建，最多size个"""
+    
+    def __init__(self, context, size: int, setup=None):
+        self._context = context
+        self._size = max(1, size)
+        self._setup = setup
+        self._created = 0
+        self._idle = asyncio.Queue()
+    
+    @asynccontextmanager
+    async def acquire(self):
+        if self._idle.empty() and self._created < self._size:
+            self._created += 1
+            try:
+                page = await self._new_page()
+            except Exception:
+                self._created -= 1
+                raise
+        else:
+            page = await self._idle.get()
+        
+        try:
+            yield page
+        finally:
+            if page.is_closed():
+                # 页面意外关闭，补一个新页面，避免等待者永远阻塞
+                try:
+                    self._idle.put_nowait(await self._new_page())
+                except Exception:
+                    self._created -= 1
+            else:
+                self._idle.put_nowait(page)
+    
+    async def _new_page(self):
+        page = await self._context.new_page()
+        if self._setup:
+            await self._setup(page)
+        return page
+
+
+class BrowserHub:
+    """多个提取器共享的Chromium实例
+    
+    在当前进程中启动一个开启远程调试端口的Chromium，其他进程可以通过
+    cdp_endpoint连接同一个浏览器；每个提取器只创建自己的上下文。
+    """
+    
+    _shared = None
+    
+    def __init__(self, cdp_endpoint: str = None, port: int = 9222, headless: bool = False):
+        """初始化浏览器中心
+        
+        Args:
+            cdp_endpoint: 已有浏览器的CDP地址，例如 http://localhost:9222；为空时自行启动
+            port: 自行启动浏览器时开启的远程调试端口
+            headless: 自行启动浏览器时是否无头运行
+        """
+        self.cdp_endpoint = cdp_endpoint
+        self.port = port
+        self.headless = headless
+        self.browser = None
+        self._pw = None
+        self._lock = asyncio.Lock()
+    
+    @classmethod
+    def shared(cls, **kwargs) -> "BrowserHub":
+        """获取进程内共享的BrowserHub"""
+        if cls._shared is None:
+            cls._shared = cls(**kwargs)
+        return cls._shared
+    
+    async def start(self) -> "BrowserHub":
+        async with self._lock:
+            if self.browser is not None:
+                return self
+            
+            self._pw = await async_playwright().start()
+            try:
+                if self.cdp_endpoint:
+                    self.browser = await self._pw.chromium.connect_over_cdp(self.cdp_endpoint)
+                else:
+                    self.browser = await self._pw.chromium.launch(
+                        headless=self.headless,
+                        args=BROWSER_ARGS + [f'--remote-debugging-port={self.port}'],
+                        timeout=30000
+                    )
+            except Exception:
+                await self._pw.stop()
+                self._pw = None
+                raise
+        return self
+    
+    async def new_context(self, **kwargs):
+        """在共享浏览器上创建新的上下文"""
+        await self.start()
+        kwargs.setdefault('user_agent', USER_AGENT)
+        kwargs.setdefault('viewport', VIEWPORT)
+        return await self.browser.new_context(**kwargs)
+    
+    async def close(self):
+        async with self._lock:
+            try:
+                if self.browser is not None:
+                    await self.browser.close()
+            finally:
+                if self._pw is not None:
+                    await self._pw.stop()
+                self.browser = None
+                self._pw = None
+
 
 class DynamicCommentExtractor:
     """动态评论提取器"""
     
-    def __init__(self, work_path: str = "Comments", cookie: str = "", use_persistent_session: bool = True, max_comments: int = None, progress_callback=None, auto_cookie: bool = True):
+    def __init__(self, work_path: str = "Comments", cookie: str = "", use_persistent_session: bool = True, max_comments: int = None, progress_callback=None, auto_cookie: bool = True, max_concurrent: int = 3, use_note_cache: bool = True, headless: bool = False, hub: Optional[BrowserHub] = None, debug: bool = False):
         """初始化评论提取器
         
         Args:
@@ -39,6 +644,11 @@ class DynamicCommentExtractor:
             max_comments: 最大评论数量限制，None表示不限制
             progress_callback: 进度回调函数
             auto_cookie: 是否启用自动Cookie获取
+            max_concurrent: 同时处理的笔记数量（标签页池大小）
+            use_note_cache: 是否使用本地笔记信息缓存
+            headless: 是否无头运行，需要手动登录时请保持False
+            hub: 共享的BrowserHub，提供时只在其浏览器上创建上下文，不使用持久化登录状态
+            debug: 是否保存页面原始状态并输出数据结构分析
         """
         self.work_path = Path(work_path)
         self.cookie = cookie
@@ -47,28 +657,188 @@ class DynamicCommentExtractor:
         self.max_comments = max_comments
         self.progress_callback = progress_callback
         self.auto_cookie = auto_cookie
+        self.max_concurrent = max_concurrent
+        self.use_note_cache = use_note_cache
+        self.headless = headless
+        self.hub = hub
+        self.debug = debug
+        
+        # 目录创建、Cookie管理器和缓存加载都涉及文件I/O，放到prepare()中在线程里完成
+        self.cookie_manager = None
+        self.storage_state_file = self.work_path / "storage_state.json"
+        self.note_cache_file = self.work_path / "note_info_cache.json"
+        self._note_cache = {}  # {note_id: {"ts": 时间戳, "data": 笔记信息}}
+        self._user_index_cache = {}  # {id(initial_state): (initial_state, {用户ID: 用户数据})}
+        self._created_dirs = set()  # 本次运行已创建的目录，避免重复mkdir
+        self._prepared = False
+        
+        # 长期复用的浏览器实例，由start()创建、aclose()释放
+        self._pw = None
+        self._browser = None
+        self._context = None
+        self._page_pool = None
+        self._login_checked = False
+        self._login_lock = asyncio.Lock()
+        self._start_lock = asyncio.Lock()
+        
+        # 评论图片下载共用一个HTTP会话，复用TCP连接
+        self._http_session = None
+        self._image_semaphore = asyncio.Semaphore(IMAGE_DOWNLOAD_CONCURRENCY)
+    
+    @classmethod
+    async def create(cls, **kwargs) -> "DynamicCommentExtractor":
+        """创建提取器并在不阻塞事件循环的情况下完成初始化"""
+        extractor = cls(**kwargs)
+        await extractor.prepare()
+        return extractor
+    
+    async def prepare(self):
+        """创建工作目录、初始化Cookie管理器并加载笔记信息缓存"""
+        if self._prepared:
+            return
         
         # 创建工作目录
-        self.work_path.mkdir(exist_ok=True)
+        await asyncio.to_thread(self.work_path.mkdir, exist_ok=True)
         
         # 初始化Cookie管理器
         if self.auto_cookie:
-            self.cookie_manager = CookieManager(str(self.work_path))
+            self.cookie_manager = await asyncio.to_thread(CookieManager, str(self.work_path))
             self.console.print("[blue]🍪 启用自动Cookie管理[/blue]")
-        else:
-            self.cookie_manager = None
         
-        # 用户数据目录 - 用于保持登录状态
-        self.user_data_dir = self.work_path / "browser_profile"
+        # 登录状态文件 - 只保存Cookie和localStorage
         if self.use_persistent_session:
-            self.user_data_dir.mkdir(exist_ok=True)
-            self.console.print(f"[blue]使用持久化浏览器配置: {self.user_data_dir}[/blue]")
+            self.console.print(f"[blue]使用持久化登录状态: {self.storage_state_file}[/blue]")
+        
+        if self.use_note_cache:
+            self._note_cache = await asyncio.to_thread(self._load_note_cache)
+        
+        self._prepared = True
+    
+    async def __aenter__(self):
+        return await self.start()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
+    async def start(self) -> "DynamicCommentExtractor":
+        """启动浏览器，多个笔记共用同一个浏览器实例"""
+        # 多个任务同时懒启动时只允许一个真正启动浏览器，其余等待后直接复用
+        async with self._start_lock:
+            return await self._start()
+    
+    async def _start(self) -> "DynamicCommentExtractor":
+        if self._context is not None:
+            return self
+        
+        await self.prepare()
+        
+        if self.hub is not None:
+            # 共享浏览器模式：只创建自己的上下文，有登录状态文件时直接复用
+            self.console.print("[green]连接共享浏览器[/green]")
+            has_state = await asyncio.to_thread(self.storage_state_file.exists)
+            self._context = await self.hub.new_context(
+                storage_state=str(self.storage_state_file) if has_state else None
+            )
+            if not has_state and self.cookie:
+                await self._context.add_cookies(self.parse_cookie_string(self.cookie))
+            self._page_pool = _PagePool(self._context, self.max_concurrent, setup=self._install_blocker)
+            return self
+        
+        self._pw = await async_playwright().start()
+        try:
+            if self.use_persistent_session:
+                # 使用持久化登录状态：普通浏览器 + storage_state，无需加载完整配置目录
+                self.console.print("[green]启动浏览器 - 使用持久化登录状态[/green]")
+                self._browser = await self._pw.chromium.launch(
+                    headless=self.headless,
+                    args=BROWSER_ARGS,
+                    timeout=30000
+                )
+                has_state = await asyncio.to_thread(self.storage_state_file.exists)
+                self._context = await self._browser.new_context(
+                    user_agent=USER_AGENT,
+                    viewport=VIEWPORT,
+                    storage_state=str(self.storage_state_file) if has_state else None
+                )
+                
+                # 还没有登录状态文件时，用已有Cookie作为初始登录状态
+                if not has_state and self.cookie:
+                    await self._context.add_cookies(self.parse_cookie_string(self.cookie))
+            else:
+                # 使用临时会话
+                self.console.print("[yellow]启动浏览器 - 临时会话模式[/yellow]")
+                self._browser = await self._pw.chromium.launch(
+                    headless=self.headless,
+                    args=BROWSER_ARGS,
+                    timeout=30000
+                )
+                self._context = await self._browser.new_context(
+                    user_agent=USER_AGENT,
+                    viewport=VIEWPORT
+                )
+                
+                # 设置Cookie（仅在临时模式下）
+                if self.cookie:
+                    await self._context.add_cookies(self.parse_cookie_string(self.cookie))
+        except Exception:
+            await self.aclose()
+            raise
+        
+        self._page_pool = _PagePool(self._context, self.max_concurrent, setup=self._install_blocker)
+        return self
+    
+    async def save_storage_state(self):
+        """保存当前上下文的Cookie和localStorage，供下次启动复用"""
+        if self._context is None or not self.use_persistent_session or self.hub is not None:
+            return
+        try:
+            await self._context.storage_state(path=str(self.storage_state_file))
+        except Exception as e:
+            self.console.print(f"[yellow]保存登录状态失败: {e}[/yellow]")
+    
+    async def aclose(self):
+        """关闭浏览器并释放Playwright"""
+        try:
+            if self._context is not None:
+                await self.save_storage_state()
+                await self._context.close()
+            if self._browser is not None:
+                await self._browser.close()
+        except Exception as e:
+            self.console.print(f"[yellow]关闭浏览器失败: {e}[/yellow]")
+        finally:
+            if self._http_session is not None:
+                await self._http_session.close()
+                self._http_session = None
+            if self._pw is not None:
+                await self._pw.stop()
+            self._pw = None
+            self._browser = None
+            self._context = None
+            self._page_pool = None
+            self._login_checked = False
+    
+    async def _install_blocker(self, page):
+        """为页面安装资源拦截，只放行文档、脚本和XHR"""
+        await page.route("**/*", self._block_resources)
+    
+    async def _block_resources(self, route):
+        if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
     
     async def ensure_cookie(self) -> bool:
         """确保有有效的Cookie"""
         if not self.auto_cookie:
             return bool(self.cookie)
         
+        await self.prepare()
+        
+        # 浏览器已启动时沿用当前会话的Cookie，避免重复验证
+        if self.cookie and self._context is not None:
+            return True
+        
         try:
             # 使用Cookie管理器获取Cookie
             cookie, is_new = await self.cookie_manager.get_cookie_automatically()
@@ -90,23 +860,45 @@ class DynamicCommentExtractor:
     
     def extract_note_id(self, url: str) -> Optional[str]:
         """从URL中提取笔记ID"""
-        patterns = [
-            r'explore/([a-fA-F0-9]+)',
-            r'discovery/item/([a-fA-F0-9]+)',
-            r'item/([a-fA-F0-9]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
+        for pattern in NOTE_ID_PATTERNS:
+            match = pattern.search(url)
             if match:
                 return match.group(1)
         return None
     
+    def _load_note_cache(self) -> Dict:
+        """加载笔记信息缓存"""
+        try:
+            if self.note_cache_file.exists():
+                return load_json_bytes(self.note_cache_file.read_bytes())
+        except Exception as e:
+            self.console.print(f"[yellow]读取笔记信息缓存失败: {e}[/yellow]")
+        return {}
+    
+    async def _save_note_cache(self, note_id: str, note_info: Dict):
+        """写入笔记信息缓存"""
+        self._note_cache[note_id] = {'ts': time.time(), 'data': note_info}
+        try:
+            # 在事件循环上序列化：其他任务会同时往缓存里插入，不能在线程里遍历共享的字典
+            data = dump_json_bytes(self._note_cache, True)
+            await asyncio.to_thread(self.note_cache_file.write_bytes, data)
+        except Exception as e:
+            self.console.print(f"[yellow]保存笔记信息缓存失败: {e}[/yellow]")
+    
     async def get_note_info_with_xhs(self, note_url: str) -> Optional[Dict]:
         """从页面中提取真实的笔记信息"""
         note_id = self.extract_note_id(note_url)
         if not note_id:
             return None
+        
+        await self.prepare()
+        
+        # 优先使用缓存，命中时无需打开页面
+        if self.use_note_cache:
+            record = self._note_cache.get(note_id)
+            if record and time.time() - record.get('ts', 0) < NOTE_CACHE_TTL:
+                self.console.print(f"[blue]使用缓存的笔记信息: {record['data'].get('作品标题')}[/blue]")
+                return {**record['data'], '作品链接': note_url}
             
         # 获取笔记信息前检查Cookie
         self.console.print("[blue]获取笔记信息前检查Cookie...[/blue]")
@@ -116,15 +908,9 @@ class DynamicCommentExtractor:
             
         # 从浏览器中获取真实的笔记标题
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=True)
-                page = await browser.new_page()
-                
-                # 设置用户代理，避免被识别为爬虫
-                await page.set_extra_http_headers({
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36'
-                })
-                
+            if self._context is None:
+                await self.start()
+            async with self._page_pool.acquire() as page:
                 # 设置Cookie（如果有的话）
                 if self.cookie:
                     await self.set_cookies(page)
@@ -132,121 +918,39 @@ class DynamicCommentExtractor:
                 # 访问页面，降低超时时间
                 try:
                     await page.goto(note_url, wait_until='domcontentloaded', timeout=15000)
-                    await page.wait_for_timeout(2000)  # 等待内容加载
                 except:
                     # 如果加载失败，尝试更快的加载方式
                     await page.goto(note_url, timeout=10000)
-                    await page.wait_for_timeout(1000)
-                
-                # 尝试多种方式提取标题
-                title = None
                 
-                # 方法1：从页面标题中提取
-                page_title = await page.title()
-                
-                if page_title and page_title != "小红书" and page_title != "安全限制":
-                    title = page_title.replace(" - 小红书", "").strip()
-                    # 过滤掉通用的页面标题
-                    invalid_titles = ["你的生活兴趣社区", "小红书_-_你的生活兴趣社区", "小红书", "你访问的页面不见了"]
-                    if title in invalid_titles or "你访问的页面不见了" in title:
-                        title = None
-                
-                # 方法2：从meta标签中提取
-                if not title:
-                    try:
-                        meta_element = await page.query_selector('meta[property="og:title"]')
-                        if meta_element:
-                            meta_title = await meta_element.get_attribute('content')
-                            if meta_title:
-                                title = meta_title.strip()
-                    except:
-                        pass
-                
-                # 方法3：从h1标签中提取
-                if not title:
-                    h1_element = await page.query_selector('h1')
-                    if h1_element:
-                        title = await h1_element.text_content()
-                        if title:
-                            title = title.strip()
-                
-                # 方法4：从JSON数据中提取
-                if not title:
-                    try:
-                        initial_state = await page.evaluate("() => window.__INITIAL_STATE__")
-                        if initial_state:
-                            # 尝试从noteDetailMap中获取标题
-                            note_data = initial_state.get('note', {}).get('noteDetailMap', {})
-                            if note_data:
-                                for key, value in note_data.items():
-                                    if isinstance(value, dict):
-                                        # 首先尝试title字段
-                                        if 'title' in value and value['title']:
-                                            candidate_title = value['title'].strip()
-                                            if candidate_title and candidate_title not in ["小红书", "你的生活兴趣社区"]:
-                                                title = candidate_title
-                                                break
-                                        # 然后尝试desc字段
-                                        if 'desc' in value and value['desc']:
-                                            desc = value['desc'].strip()
-                                            if desc and len(desc) > 5 and desc not in ["小红书", "你的生活兴趣社区"]:
-                                                title = desc[:30] + ("..." if len(desc) > 30 else "")
-                                                break
-                                        # 尝试从note字段中提取
-                                        if 'note' in value and isinstance(value['note'], dict):
-                                            note_info = value['note']
-                                            if 'title' in note_info and note_info['title']:
-                                                candidate_title = note_info['title'].strip()
-                                                if candidate_title and candidate_title not in ["小红书", "你的生活兴趣社区"]:
-                                                    title = candidate_title
-                                                    break
-                                            if 'desc' in note_info and note_info['desc']:
-                                                desc = note_info['desc'].strip()
-                                                if desc and len(desc) > 5 and desc not in ["小红书", "你的生活兴趣社区"]:
-                                                    title = desc[:30] + ("..." if len(desc) > 30 else "")
-                                                    break
-                    except:
-                        pass
-                
-                # 方法5：从特定选择器中提取
-                if not title:
-                    try:
-                        # 尝试更多可能的选择器
-                        selectors = [
-                            '[data-v-*] .title',
-                            '.note-content .title',
-                            '.note-detail .title',
-                            '.content .title',
-                            '.note-scroller .title'
-                        ]
-                        
-                        for selector in selectors:
-                            try:
-                                element = await page.query_selector(selector)
-                                if element:
-                                    text = await element.text_content()
-                                    if text and text.strip():
-                                        title = text.strip()
-                                        break
-                            except:
-                                continue
-                    except:
-                        pass
-                
-                await browser.close()
+                # 等待标题元素或笔记状态出现，不再固定等待
+                try:
+                    await page.wait_for_function(
+                        ELEMENTS_READY_JS,
+                        arg={'noteState': True, 'selectors': TITLE_SELECTORS + ['h1'], 'texts': []},
+                        timeout=TITLE_READY_TIMEOUT
+                    )
+                except Exception:
+                    pass
                 
-                # 如果成功获取到标题，验证是否有效
-                if title and title not in ["小红书", "你的生活兴趣社区", "小红书_-_你的生活兴趣社区"]:
-                    self.console.print(f"[green]✓ 成功获取笔记标题: {title}[/green]")
-                    return {
-                        '作品标题': title,
-                        '作品描述': '通过评论提取器获取',
-                        '作品ID': note_id,
-                        '作品链接': note_url
-                    }
-                else:
-                    self.console.print(f"[yellow]未能提取到有效笔记标题，将使用预设映射[/yellow]")
-                        
+                # 一次evaluate取回所有标题候选，在Python侧按优先级挑选
+                candidates = await page.evaluate(TITLE_CANDIDATES_JS, TITLE_SELECTORS)
+                title = self.pick_note_title(candidates)
+            
+            # 如果成功获取到标题，验证是否有效
+            if title and title not in ["小红书", "你的生活兴趣社区", "小红书_-_你的生活兴趣社区"]:
+                self.console.print(f"[green]✓ 成功获取笔记标题: {title}[/green]")
+                note_info = {
+                    '作品标题': title,
+                    '作品描述': '通过评论提取器获取',
+                    '作品ID': note_id,
+                    '作品链接': note_url
+                }
+                if self.use_note_cache:
+                    await self._save_note_cache(note_id, note_info)
+                return note_info
+            else:
+                self.console.print(f"[yellow]未能提取到有效笔记标题，将使用预设映射[/yellow]")
+                    
         except Exception as e:
             self.console.print(f"[yellow]获取笔记标题失败: {e}[/yellow]")
         
@@ -268,9 +972,71 @@ class DynamicCommentExtractor:
             '作品链接': note_url
         }
     
-    async def extract_comments_with_browser(self, note_url: str, note_id: str) -> List[Dict]:
-        """使用浏览器自动化提取动态评论"""
+    def pick_note_title(self, candidates: Dict) -> Optional[str]:
+        """按页面标题、og:title、h1、noteDetailMap、特定选择器的顺序挑选标题"""
+        # 方法1：从页面标题中提取
+        page_title = candidates.get('title')
+        if page_title and page_title != "小红书" and page_title != "安全限制":
+            title = page_title.replace(" - 小红书", "").strip()
+            # 过滤掉通用的页面标题
+            invalid_titles = ["你的生活兴趣社区", "小红书_-_你的生活兴趣社区", "小红书", "你访问的页面不见了"]
+            if title and title not in invalid_titles and "你访问的页面不见了" not in title:
+                return title
+        
+        # 方法2：从meta标签中提取；方法3：从h1标签中提取
+        for key in ('meta', 'h1'):
+            text = candidates.get(key)
+            if text and text.strip():
+                return text.strip()
+        
+        # 方法4：从JSON数据中提取
+        note_detail_map = candidates.get('state')
+        if isinstance(note_detail_map, dict):
+            title = self.pick_title_from_note_detail_map(note_detail_map)
+            if title:
+                return title
+        
+        # 方法5：从特定选择器中提取
+        return next((text.strip() for text in candidates.get('texts') or [] if text and text.strip()), None)
+    
+    def pick_title_from_note_detail_map(self, note_detail_map: Dict) -> Optional[str]:
+        """按title、desc、note.title、note.desc的顺序从noteDetailMap中挑选标题"""
+        for value in note_detail_map.values():
+            if not isinstance(value, dict):
+                continue
+            note_info = value.get('note')
+            if not isinstance(note_info, dict):
+                note_info = {}
+            
+            for candidate, is_desc in (
+                (value.get('title'), False),
+                (value.get('desc'), True),
+                (note_info.get('title'), False),
+                (note_info.get('desc'), True),
+            ):
+                if not candidate or not isinstance(candidate, str):
+                    continue
+                candidate = candidate.strip()
+                if not candidate or candidate in STATE_INVALID_TITLES:
+                    continue
+                if not is_desc:
+                    return candidate
+                # desc作为标题时需要足够长，并截取前30个字符
+                if len(candidate) > 5:
+                    return candidate[:30] + ("..." if len(candidate) > 30 else "")
+        return None
+    
+    async def extract_comments_with_browser(self, note_url: str, note_id: str, stream_path: Optional[Path] = None) -> List[Dict]:
+        """使用浏览器自动化提取动态评论
+        
+        Args:
+            note_url: 笔记链接
+            note_id: 笔记ID
+            stream_path: 可选的JSONL文件路径，每页评论到达后立即追加写入
+        """
         comments = []
+        if stream_path:
+            await asyncio.to_thread(stream_path.unlink, missing_ok=True)
         
         # 在开始浏览器操作前检查Cookie
         self.console.print("[blue]浏览器启动前检查Cookie...[/blue]")
@@ -278,75 +1044,36 @@ class DynamicCommentExtractor:
         if not cookie_valid:
             self.console.print("[yellow]Cookie检查失败，将依赖持久化会话或手动登录[/yellow]")
         
-        async with async_playwright() as p:
-            # 准备浏览器启动参数
-            browser_args = [
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--no-sandbox',
-                '--disable-extensions',
-                '--disable-plugins',
-                '--disable-web-security',
-                '--disable-features=VizDisplayCompositor',
-                '--disable-background-timer-throttling',
-                '--disable-backgrounding-occluded-windows',
-                '--disable-renderer-backgrounding',
-                '--no-first-run',
-                '--disable-default-apps'
-            ]
-            
-            if self.use_persistent_session:
-                # 使用持久化上下文
-                self.console.print("[green]启动浏览器 - 使用持久化登录状态[/green]")
-                
-                context = await p.chromium.launch_persistent_context(
-                    str(self.user_data_dir),
-                    headless=False,
-                    args=browser_args,
-                    user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-                    viewport={'width': 1280, 'height': 720},
-                    timeout=30000
-                )
-                
-                # 创建或获取页面
-                if context.pages:
-                    # 使用现有页面
-                    page = context.pages[0]
-                    self.console.print("[blue]使用现有浏览器页面[/blue]")
-                else:
-                    # 创建新页面
-                    page = await context.new_page()
-                    self.console.print("[blue]创建新浏览器页面[/blue]")
-                
-                browser = None  # 持久化上下文不需要单独的browser对象
-                
-            else:
-                # 使用临时会话
-                self.console.print("[yellow]启动浏览器 - 临时会话模式[/yellow]")
-                
-                browser = await p.chromium.launch(
-                    headless=False,
-                    args=browser_args,
-                    timeout=30000
-                )
-                
-                context = await browser.new_context(
-                    user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-                    viewport={'width': 1280, 'height': 720}
-                )
-                
-                # 设置Cookie（仅在临时模式下）
-                if self.cookie:
-                    await context.add_cookies(self.parse_cookie_string(self.cookie))
-                
-                # 创建新页面
-                page = await context.new_page()
-                self.console.print("[blue]创建新浏览器页面[/blue]")
-            
+        if self._context is None:
+            await self.start()
+        
+        # 评论接口响应队列，分页直接读取接口JSON，不再依赖DOM
+        responses = asyncio.Queue()
+        
+        async def on_response(response):
+            if response.status == 200 and COMMENT_API_PATTERN.search(response.url):
+                try:
+                    # 每页响应独立解析一次（有orjson时用orjson），不会重复解析已处理的页面
+                    responses.put_nowait(load_json_bytes(await response.body()))
+                except Exception:
+                    pass
+        
+        # 从标签页池中取出页面，用完归还供后续笔记复用
+        async with self._page_pool.acquire() as page:
+            page.on("response", on_response)
             try:
-                # 如果是持久化模式，首先检查登录状态
-                if self.use_persistent_session:
-                    await self.check_and_guide_login(page)
+                # 如果是持久化模式，首先检查登录状态（每个浏览器会话只检查一次）
+                if self.use_persistent_session and self.hub is None:
+                    async with self._login_lock:
+                        if not self._login_checked:
+                            # 登录二维码等需要加载图片，检查登录期间暂停资源拦截
+                            await page.unroute("**/*", self._block_resources)
+                            try:
+                                if await self.check_and_guide_login(page):
+                                    await self.save_storage_state()
+                            finally:
+                                await page.route("**/*", self._block_resources)
+                            self._login_checked = True
                 
                 self.console.print(f"[blue]浏览器访问页面: {note_url}[/blue]")
                 
@@ -356,15 +1083,8 @@ class DynamicCommentExtractor:
                     self.console.print("[green]页面加载完成[/green]")
                 except Exception as goto_error:
                     self.console.print(f"[yellow]页面加载超时，尝试继续: {goto_error}[/yellow]")
-                    # 如果页面加载超时，尝试直接访问不等待完全加载
-                    try:
-                        await page.goto(note_url, wait_until='load', timeout=15000)
-                    except:
-                        # 最后的备用方案：不等待任何条件
-                        await page.goto(note_url, timeout=10000)
-                
-                # 等待页面加载
-                await asyncio.sleep(3)
+                    # 静态资源已被拦截，直接重试一次，不再等待load事件
+                    await page.goto(note_url, wait_until='commit', timeout=10000)
                 
                 self.console.print("[blue]滚动页面以触发评论加载...[/blue]")
                 
@@ -375,9 +1095,6 @@ class DynamicCommentExtractor:
                     }
                 """)
                 
-                # 等待评论加载
-                await asyncio.sleep(3)
-                
                 # 查找评论容器并点击
                 try:
                     # 尝试找到评论区域
@@ -389,21 +1106,17 @@ class DynamicCommentExtractor:
                         '.comment-list'
                     ]
                     
-                    for selector in comment_containers:
-                        elements = await page.query_selector_all(selector)
-                        if elements:
-                            self.console.print(f"[green]找到评论容器: {selector}[/green]")
-                            # 滚动到评论区域
-                            await elements[0].scroll_into_view_if_needed()
-                            await asyncio.sleep(2)
-                            break
-                    
-                    # 等待评论动态加载
-                    await asyncio.sleep(5)
-                    
+                    # 在页面内依次匹配并滚动到第一个评论容器
+                    selector = await page.evaluate(SCROLL_TO_FIRST_JS, comment_containers)
+                    if selector:
+                        self.console.print(f"[green]找到评论容器: {selector}[/green]")
+                
                 except Exception as e:
                     self.console.print(f"[yellow]查找评论容器失败: {e}[/yellow]")
                 
+                # 等待评论接口返回，而不是固定等待
+                got_response = await self.wait_for_comment_response(page, responses)
+                
                 # 检查页面是否可访问
                 page_title = await page.title()
                 page_url = page.url
@@ -415,8 +1128,15 @@ class DynamicCommentExtractor:
                     self.console.print("[red]页面无法访问或已被删除[/red]")
                     return comments
                 
-                # 实现分页获取所有评论
-                comments = await self.get_all_comments_with_pagination(page, note_id)
+                # 实现分页获取所有评论，优先使用评论接口数据；
+                # 上面已经等满超时且队列仍为空时不再重复等待，直接从页面状态解析
+                if got_response or not responses.empty():
+                    comments = await self.get_all_comments_from_api(page, responses, stream_path)
+                else:
+                    comments = None
+                if comments is None:
+                    self.console.print("[yellow]未捕获到评论接口响应，改为从页面状态解析[/yellow]")
+                    comments = await self.get_all_comments_with_pagination(page, note_id, stream_path)
                 
                 # 如果还是没有评论，尝试从DOM直接解析
                 if not comments:
@@ -427,20 +1147,89 @@ class DynamicCommentExtractor:
             except Exception as e:
                 self.console.print(f"[red]浏览器获取评论失败: {e}[/red]")
             finally:
-                # 关闭浏览器
-                if browser:
-                    await browser.close()
-                else:
-                    # 持久化上下文，只关闭上下文
-                    await context.close()
+                page.remove_listener("response", on_response)
         
         return comments
     
-    async def get_all_comments_with_pagination(self, page, note_id: str) -> List[Dict]:
+    async def wait_for_comment_response(self, page, responses: asyncio.Queue) -> bool:
+        """等待评论接口响应，超时后短暂等待再继续"""
+        if not responses.empty():
+            return True
+        
+        try:
+            await page.wait_for_event(
+                "response",
+                predicate=lambda r: r.status == 200 and COMMENT_API_PATTERN.search(r.url) is not None,
+                timeout=COMMENT_RESPONSE_TIMEOUT * 1000
+            )
+            return True
+        except Exception:
+            await asyncio.sleep(0.5)
+            return False
+    
+    async def get_all_comments_from_api(self, page, responses: asyncio.Queue, stream_path: Optional[Path] = None) -> Optional[List[Dict]]:
+        """从评论分页接口的响应中获取所有评论
+        
+        Returns:
+            评论列表；第一页接口响应未到达时返回None，由调用方回退到页面状态解析
+        """
+        all_comments = []
+        seen_ids = set()
+        page_count = 0
+        max_pages = 50  # 最大页数限制，防止无限循环
+        
+        while page_count < max_pages:
+            try:
+                data = await asyncio.wait_for(responses.get(), timeout=COMMENT_RESPONSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                if page_count == 0:
+                    return None
+                self.console.print("[yellow]等待评论接口响应超时，停止分页[/yellow]")
+                break
+            
+            page_count += 1
+            payload = data.get('data') or {}
+            current_comments = self.process_comment_list(payload.get('comments') or [], {})
+            
+            if current_comments:
+                # 过滤重复评论（基于评论ID）
+                new_comments = [c for c in current_comments if c.get('id', '') not in seen_ids]
+                
+                if self.max_comments and len(all_comments) + len(new_comments) > self.max_comments:
+                    needed_count = self.max_comments - len(all_comments)
+                    new_comments = new_comments[:needed_count]
+                    self.console.print(f"[yellow]已达到数量限制，只取前 {needed_count} 条评论[/yellow]")
+                
+                all_comments.extend(new_comments)
+                seen_ids.update(c.get('id', '') for c in new_comments)
+                if stream_path:
+                    await self.append_comments_jsonl(stream_path, new_comments)
+                self.console.print(f"[green]接口第 {page_count} 页获取到 {len(new_comments)} 条新评论（总计 {len(all_comments)} 条）[/green]")
+                
+                if self.max_comments and len(all_comments) >= self.max_comments:
+                    self.console.print(f"[green]已获取到指定数量的评论：{len(all_comments)} 条[/green]")
+                    break
+            
+            if not payload.get('has_more'):
+                self.console.print(f"[green]已获取所有评论，共 {len(all_comments)} 条[/green]")
+                break
+            
+            # 队列中已有后续页面时无需再次触发加载
+            if responses.empty():
+                await page.evaluate("() => window.scrollBy(0, 4000)")
+                await self.load_more_comments(page)
+        
+        self.console.print(f"[green]接口分页获取完成，总共获取到 {len(all_comments)} 条评论[/green]")
+        return all_comments
+    
+    async def get_all_comments_with_pagination(self, page, note_id: str, stream_path: Optional[Path] = None) -> List[Dict]:
         """分页获取所有评论"""
         all_comments = []
+        seen_ids = set()
         page_count = 0
         max_pages = 50  # 最大页数限制，防止无限循环 (最多500条评论)
+        initial_state = None
+        raw_offset = 0  # 已读取的原始评论数，后续分页只取增量
         
         if self.max_comments:
             self.console.print(f"[blue]开始分页获取最新 {self.max_comments} 条评论...[/blue]")
@@ -453,30 +1242,40 @@ class DynamicCommentExtractor:
             
             # 获取当前页面的评论数据
             try:
-                initial_state = await page.evaluate("""
-                    () => {
-                        if (window.__INITIAL_STATE__) {
-                            return window.__INITIAL_STATE__;
-                        }
-                        return null;
-                    }
-                """)
-                
-                if not initial_state:
-                    self.console.print("[yellow]无法获取页面状态数据[/yellow]")
-                    break
-                
-                # 调试：保存第一页的原始数据结构
                 if page_count == 1:
-                    await self.debug_save_initial_state(initial_state, note_id)
-                
-                # 解析当前页评论
-                current_comments = self.extract_comments_from_state(initial_state, note_id)
+                    # 第一页只读取评论和用户子树；调试模式或子树中没有评论时才读取完整状态
+                    initial_state = None if self.debug else await page.evaluate(STATE_SUBSET_JS, note_id)
+                    if not self.check_has_state_comments(initial_state, note_id):
+                        state_json = await page.evaluate(FULL_STATE_JS)
+                        initial_state = load_json_bytes(state_json) if state_json else None
+                    
+                    if not initial_state:
+                        self.console.print("[yellow]无法获取页面状态数据[/yellow]")
+                        break
+                    
+                    # 调试：保存第一页的原始数据结构
+                    if self.debug:
+                        await self.debug_save_initial_state(initial_state, note_id)
+                    
+                    # 解析当前页评论
+                    current_comments = self.extract_comments_from_state(initial_state, note_id)
+                    comment_data = initial_state.get('note', {}).get('noteDetailMap', {}).get(note_id, {}).get('comments', {})
+                    raw_offset = len(comment_data.get('list', []))
+                else:
+                    # 后续分页只取新增的评论，避免每页都序列化整个状态
+                    comment_data = await page.evaluate(COMMENTS_DELTA_JS, {'id': note_id, 'seen': raw_offset})
+                    
+                    if not comment_data:
+                        self.console.print("[yellow]无法获取页面状态数据[/yellow]")
+                        break
+                    
+                    raw_list = comment_data.get('list', [])
+                    raw_offset += len(raw_list)
+                    current_comments = self.process_comment_list(raw_list, initial_state)
                 
                 if current_comments:
                     # 过滤重复评论（基于评论ID）
-                    existing_ids = {comment.get('id', '') for comment in all_comments}
-                    new_comments = [c for c in current_comments if c.get('id', '') not in existing_ids]
+                    new_comments = [c for c in current_comments if c.get('id', '') not in seen_ids]
                     
                     if new_comments:
                         # 检查是否超过数量限制
@@ -487,6 +1286,9 @@ class DynamicCommentExtractor:
                             self.console.print(f"[yellow]已达到数量限制，只取前 {needed_count} 条评论[/yellow]")
                         
                         all_comments.extend(new_comments)
+                        seen_ids.update(c.get('id', '') for c in new_comments)
+                        if stream_path:
+                            await self.append_comments_jsonl(stream_path, new_comments)
                         self.console.print(f"[green]第 {page_count} 页获取到 {len(new_comments)} 条新评论（总计 {len(all_comments)} 条）[/green]")
                         
                         # 检查是否已达到数量限制
@@ -498,7 +1300,7 @@ class DynamicCommentExtractor:
                         break
                 
                 # 检查是否还有更多评论
-                has_more = self.check_has_more_comments(initial_state, note_id)
+                has_more = self.check_has_more_comments(comment_data)
                 if not has_more:
                     self.console.print(f"[green]已获取所有评论，共 {len(all_comments)} 条[/green]")
                     break
@@ -506,8 +1308,15 @@ class DynamicCommentExtractor:
                 # 尝试加载更多评论
                 await self.load_more_comments(page)
                 
-                # 等待新评论加载
-                await asyncio.sleep(3)
+                # 等待页面状态中出现新评论（或已无更多评论）
+                try:
+                    await page.wait_for_function(
+                        COMMENTS_GROWN_JS,
+                        arg={'id': note_id, 'seen': raw_offset},
+                        timeout=3000
+                    )
+                except Exception:
+                    pass
                 
             except Exception as e:
                 self.console.print(f"[yellow]第 {page_count} 页获取失败: {e}[/yellow]")
@@ -521,17 +1330,33 @@ class DynamicCommentExtractor:
         self.console.print(f"[green]分页获取完成，总共获取到 {len(all_comments)} 条评论[/green]")
         return all_comments
     
-    def check_has_more_comments(self, initial_state: Dict, note_id: str) -> bool:
+    def check_has_state_comments(self, state: Optional[Dict], note_id: str) -> bool:
+        """状态数据中noteDetailMap下是否已有评论列表"""
+        if not state:
+            return False
+        comment_data = state.get('note', {}).get('noteDetailMap', {}).get(note_id, {}).get('comments', {})
+        return bool(comment_data.get('list'))
+    
+    async def append_comments_jsonl(self, stream_path: Path, comments: List[Dict]):
+        """将一页评论追加写入JSONL文件（每行一条，去掉raw_data）"""
+        try:
+            lines = b''.join(
+                dump_json_bytes(without_raw_data(c)) + b'\n'
+                for c in comments
+            )
+            async with aiofiles.open(stream_path, 'ab') as f:
+                await f.write(lines)
+        except Exception as e:
+            self.console.print(f"[yellow]写入评论流文件失败: {e}[/yellow]")
+    
+    def check_has_more_comments(self, comment_data: Dict) -> bool:
         """检查是否还有更多评论"""
         try:
-            note_detail_map = initial_state.get('note', {}).get('noteDetailMap', {})
-            if note_id in note_detail_map:
-                comment_data = note_detail_map[note_id].get('comments', {})
-                has_more = comment_data.get('hasMore', False)
-                loading = comment_data.get('loading', False)
-                
-                self.console.print(f"[blue]评论状态检查 - hasMore: {has_more}, loading: {loading}[/blue]")
-                return has_more and not loading
+            has_more = comment_data.get('hasMore', False)
+            loading = comment_data.get('loading', False)
+            
+            self.console.print(f"[blue]评论状态检查 - hasMore: {has_more}, loading: {loading}[/blue]")
+            return has_more and not loading
         except Exception as e:
             self.console.print(f"[yellow]检查更多评论状态失败: {e}[/yellow]")
         
@@ -550,48 +1375,14 @@ class DynamicCommentExtractor:
                 '[class*="more-comment"]'
             ]
             
-            button_found = False
-            for selector in load_more_selectors:
-                try:
-                    button = await page.wait_for_selector(selector, timeout=2000)
-                    if button:
-                        await button.click()
-                        self.console.print(f"[green]点击加载更多按钮: {selector}[/green]")
-                        button_found = True
-                        break
-                except:
-                    continue
-            
-            if not button_found:
-                # 方法2: 滚动到评论区底部
-                await page.evaluate("""
-                    () => {
-                        // 查找评论容器
-                        const commentContainers = document.querySelectorAll('.comments-el, [class*="comment"]');
-                        if (commentContainers.length > 0) {
-                            const lastContainer = commentContainers[commentContainers.length - 1];
-                            lastContainer.scrollIntoView({ behavior: 'smooth' });
-                        } else {
-                            // 滚动到页面底部
-                            window.scrollTo({ top: document.body.scrollHeight, behavior: 'smooth' });
-                        }
-                    }
-                """)
+            # 在页面内一次完成：点击第一个找到的按钮，找不到时滚动到评论区底部（方法2），
+            # 最后触发滚动事件（方法3）
+            clicked = await page.evaluate(LOAD_MORE_JS, load_more_selectors)
+            if clicked:
+                self.console.print(f"[green]点击加载更多按钮: {clicked}[/green]")
+            else:
                 self.console.print("[blue]滚动到评论区底部触发加载[/blue]")
             
-            # 方法3: 尝试触发更多评论的JavaScript事件
-            await page.evaluate("""
-                () => {
-                    // 触发滚动事件
-                    window.dispatchEvent(new Event('scroll'));
-                    
-                    // 尝试查找并触发评论加载的相关函数
-                    if (window.__INITIAL_STATE__ && window.__INITIAL_STATE__.note) {
-                        // 这里可以添加小红书特定的加载更多评论的逻辑
-                    }
-                }
-            """)
-            
         except Exception as e:
             self.console.print(f"[yellow]加载更多评论失败: {e}[/yellow]")
     
@@ -601,7 +1392,6 @@ class DynamicCommentExtractor:
             # 先访问小红书首页检查登录状态
             self.console.print("[blue]检查登录状态...[/blue]")
             await page.goto("https://www.xiaohongshu.com", wait_until='domcontentloaded', timeout=15000)
-            await asyncio.sleep(2)
             
             # 检查是否已登录（查找用户头像或登录按钮）
             login_selectors = [
@@ -617,6 +1407,18 @@ class DynamicCommentExtractor:
                 '[data-v*="user"]',
                 '.user-avatar'
             ]
+            login_css = [sel for sel in login_selectors if not sel.startswith('text=')]
+            login_texts = [sel[len('text='):] for sel in login_selectors if sel.startswith('text=')]
+            
+            # 等待登录按钮或用户元素渲染出来，不再固定等待
+            try:
+                await page.wait_for_function(
+                    ELEMENTS_READY_JS,
+                    arg={'noteState': False, 'selectors': user_selectors + login_css, 'texts': login_texts},
+                    timeout=LOGIN_READY_TIMEOUT
+                )
+            except Exception:
+                pass
             
             # 检查是否有登录按钮（未登录）
             login_button = None
@@ -634,51 +1436,33 @@ class DynamicCommentExtractor:
                 
                 # 点击登录按钮
                 await login_button.click()
-                await asyncio.sleep(2)
+                # 点击可能跳转到登录页，等新页面加载完再开始判断登录状态
+                await page.wait_for_load_state('domcontentloaded')
                 
                 # 等待用户手动登录
                 self.console.print("[green]请在浏览器中完成登录操作[/green]")
                 self.console.print("[yellow]登录完成后，程序将自动继续...[/yellow]")
                 
-                # 等待登录完成（检查用户元素出现）
+                # 等待登录完成：页面内轮询，用户元素出现或登录按钮消失即返回
                 max_wait = 300  # 最多等待5分钟
-                check_interval = 5  # 每5秒检查一次
-                
-                for i in range(max_wait // check_interval):
-                    await asyncio.sleep(check_interval)
-                    
-                    # 检查是否已登录
-                    logged_in = False
-                    for user_selector in user_selectors:
-                        try:
-                            user_element = await page.query_selector(user_selector)
-                            if user_element:
-                                logged_in = True
-                                break
-                        except:
-                            continue
-                    
-                    if logged_in:
-                        self.console.print("[green]✓ 登录成功！登录状态已保存[/green]")
-                        return True
-                    
-                    # 检查登录按钮是否还存在
-                    login_still_exists = False
-                    for login_selector in login_selectors:
-                        try:
-                            login_element = await page.query_selector(login_selector)
-                            if login_element:
-                                login_still_exists = True
-                                break
-                        except:
-                            continue
-                    
-                    if not login_still_exists:
-                        self.console.print("[green]✓ 登录状态检测成功[/green]")
-                        return True
-                    
-                    if i % 6 == 0:  # 每30秒提示一次
-                        self.console.print(f"[blue]等待登录中... ({i * check_interval}/{max_wait}秒)[/blue]")
+                reporter = asyncio.create_task(self._report_login_wait(max_wait))
+                try:
+                    await page.wait_for_function(
+                        LOGIN_DONE_JS,
+                        arg={
+                            'userSelectors': user_selectors,
+                            'loginSelectors': login_css,
+                            'loginTexts': login_texts
+                        },
+                        timeout=max_wait * 1000,
+                        polling=1000
+                    )
+                    self.console.print("[green]✓ 登录成功！登录状态已保存[/green]")
+                    return True
+                except Exception:
+                    pass
+                finally:
+                    reporter.cancel()
                 
                 self.console.print("[red]登录等待超时，将继续尝试提取[/red]")
                 return False
@@ -700,6 +1484,12 @@ class DynamicCommentExtractor:
             self.console.print(f"[yellow]登录状态检查失败: {e}[/yellow]")
             return True
     
+    async def _report_login_wait(self, max_wait: int):
+        """等待登录期间每30秒提示一次"""
+        for waited in range(0, max_wait, 30):
+            self.console.print(f"[blue]等待登录中... ({waited}/{max_wait}秒)[/blue]")
+            await asyncio.sleep(30)
+    
     async def set_cookies(self, page):
         """设置Cookie到页面"""
         if not self.cookie:
@@ -718,17 +1508,11 @@ class DynamicCommentExtractor:
     
     def parse_cookie_string(self, cookie_string: str) -> List[Dict]:
         """解析Cookie字符串为Playwright格式"""
-        cookies = []
-        for item in cookie_string.split(';'):
-            if '=' in item:
-                name, value = item.strip().split('=', 1)
-                cookies.append({
-                    'name': name,
-                    'value': value,
-                    'domain': '.xiaohongshu.com',
-                    'path': '/'
-                })
-        return cookies
+        return [
+            {'name': name, 'value': value, **COOKIE_BASE}
+            for name, sep, value in (item.strip().partition('=') for item in cookie_string.split(';'))
+            if sep
+        ]
     
     def extract_comments_from_state(self, initial_state: Dict, note_id: str) -> List[Dict]:
         """从__INITIAL_STATE__中提取评论"""
@@ -745,18 +1529,15 @@ class DynamicCommentExtractor:
                 
                 if comment_list:
                     self.console.print(f"[green]从noteDetailMap获取到 {len(comment_list)} 条原始评论[/green]")
-                    # 处理每条评论，提取完整信息
-                    for raw_comment in comment_list:
-                        processed_comment = self.process_raw_comment(raw_comment, initial_state)
-                        if processed_comment:
-                            comments.append(processed_comment)
-                    self.console.print(f"[green]处理后得到 {len(comments)} 条完整评论[/green]")
+                    comments.extend(self.process_comment_list(comment_list, initial_state))
                 else:
                     self.console.print(f"[yellow]noteDetailMap中评论列表为空，hasMore: {comment_data.get('hasMore')}, loading: {comment_data.get('loading')}[/yellow]")
             
             # 递归搜索其他可能的评论位置
             if not comments:
-                recursive_comments = self.recursive_search_comments(initial_state)
+                recursive_comments = self.recursive_search_comments(
+                    initial_state, limit=self.max_comments or RECURSIVE_SEARCH_LIMIT
+                )
                 if recursive_comments:
                     self.console.print(f"[green]递归搜索找到 {len(recursive_comments)} 条评论[/green]")
                     comments.extend(recursive_comments)
@@ -766,60 +1547,63 @@ class DynamicCommentExtractor:
         
         return comments
     
-    def process_raw_comment(self, raw_comment: Dict, initial_state: Dict) -> Optional[Dict]:
+    def process_comment_list(self, comment_list: List[Dict], initial_state: Dict) -> List[Dict]:
+        """处理每条原始评论，提取完整信息"""
+        comments = []
+        now = datetime.now()  # 同一批评论共用一个当前时间
+        for raw_comment in comment_list:
+            processed_comment = self.process_raw_comment(raw_comment, initial_state, now)
+            if processed_comment:
+                comments.append(processed_comment)
+        self.console.print(f"[green]处理后得到 {len(comments)} 条完整评论[/green]")
+        return comments
+    
+    def process_raw_comment(self, raw_comment: Dict, initial_state: Dict,
+                            now: Optional[datetime] = None) -> Optional[Dict]:
         """处理原始评论数据，补充用户信息和时间"""
         try:
-            comment_id = raw_comment.get('id', '')
-            content = raw_comment.get('content', '')
-            
-            # 获取时间 - 注意字段名是createTime而不是create_time
-            create_time = raw_comment.get('createTime', raw_comment.get('create_time', 0))
+            now = now or datetime.now()
+            processed_comment = {
+                name: _first_present(raw_comment, aliases, default)
+                for name, aliases, default in RAW_COMMENT_FIELDS
+            }
             
-            # 获取用户信息 - 直接从评论中的userInfo字段获取
-            user_info_raw = raw_comment.get('userInfo', {})
+            # 获取用户信息 - 直接从评论中的userInfo/user_info字段获取
+            user_info_raw = _first_present(raw_comment, ('userInfo', 'user_info'))
             if user_info_raw:
                 user_info = {
                     'nickname': user_info_raw.get('nickname', '匿名用户'),
-                    'user_id': user_info_raw.get('userId', ''),
+                    'user_id': _first_present(user_info_raw, ('userId', 'user_id'), ''),
                     'avatar': user_info_raw.get('image', ''),
-                    'xsec_token': user_info_raw.get('xsecToken', '')
+                    'xsec_token': _first_present(user_info_raw, ('xsecToken', 'xsec_token'), '')
                 }
             else:
                 # 备用方案：从user_id查找
-                user_id = raw_comment.get('user_id', raw_comment.get('userId', raw_comment.get('uid', '')))
+                user_id = _first_present(raw_comment, ('user_id', 'userId', 'uid'), '')
                 user_info = self.get_user_info_from_state(user_id, initial_state)
+            processed_comment['user_info'] = user_info
             
             # 处理时间戳
+            create_time = processed_comment['create_time']
             if isinstance(create_time, str):
-                create_time = self.parse_time_string(create_time)
+                processed_comment['create_time'] = self.parse_time_string(create_time, now)
             elif create_time == 0 or create_time is None:
                 # 尝试从其他字段获取时间
-                create_time = raw_comment.get('time', raw_comment.get('timestamp', int(time.time() * 1000)))
+                processed_comment['create_time'] = (
+                    _first_present(raw_comment, ('time', 'timestamp')) or int(now.timestamp() * 1000)
+                )
             
             # 处理图片 - 字段名是pictures而不是images
-            images = raw_comment.get('pictures', raw_comment.get('images', raw_comment.get('pics', [])))
-            if not isinstance(images, list):
-                images = []
+            if not isinstance(processed_comment['images'], list):
+                processed_comment['images'] = []
             
-            # 处理IP位置
-            ip_location = raw_comment.get('ipLocation', '')
-            
-            processed_comment = {
-                'id': comment_id,
-                'content': content,
-                'create_time': create_time,
-                'user_info': user_info,
-                'images': images,
-                'ip_location': ip_location,
-                'like_count': raw_comment.get('likeCount', '0'),
-                'sub_comment_count': raw_comment.get('subCommentCount', '0'),
-                'raw_data': raw_comment  # 保留原始数据用于调试
-            }
+            if self.debug:
+                processed_comment['raw_data'] = raw_comment  # 仅调试模式保留原始数据
             
             return processed_comment
             
         except Exception as e:
-            self.console.print(f"[yellow]处理评论数据失败: {e}[/yellow]")
+            logger.warning("处理评论数据失败: %s", e)
             return None
     
     def get_user_info_from_state(self, user_id: str, initial_state: Dict) -> Dict:
@@ -828,133 +1612,155 @@ class DynamicCommentExtractor:
             return {'nickname': '匿名用户'}
         
         try:
-            # 尝试从userMap中获取用户信息
-            user_map = initial_state.get('user', {}).get('userMap', {})
-            if user_id in user_map:
-                user_data = user_map[user_id]
+            # userMap与状态树中其他位置的用户统一建立索引，这里只需一次字典查找
+            user_data = self._get_user_index(initial_state).get(user_id)
+            if user_data:
                 return {
-                    'nickname': user_data.get('nickname', user_data.get('name', '匿名用户')),
+                    'nickname': _first_present(user_data, ('nickname', 'name'), '匿名用户'),
                     'user_id': user_id,
                     'avatar': user_data.get('avatar', ''),
                     'level': user_data.get('level', 0)
                 }
             
-            # 尝试从其他可能的位置查找用户信息
-            all_users = self.find_all_users_in_state(initial_state)
-            for user_data in all_users:
-                if (user_data.get('id') == user_id or 
-                    user_data.get('user_id') == user_id or 
-                    user_data.get('userId') == user_id):
-                    return {
-                        'nickname': user_data.get('nickname', user_data.get('name', '匿名用户')),
-                        'user_id': user_id,
-                        'avatar': user_data.get('avatar', ''),
-                        'level': user_data.get('level', 0)
-                    }
-            
         except Exception as e:
-            self.console.print(f"[yellow]获取用户信息失败: {e}[/yellow]")
+            logger.warning("获取用户信息失败: %s", e)
         
         return {'nickname': f'用户_{user_id[:8]}', 'user_id': user_id}
     
-    def find_all_users_in_state(self, data: Dict, max_depth: int = 3) -> List[Dict]:
-        """递归查找所有用户信息"""
-        users = []
+    def _get_user_index(self, initial_state: Dict) -> Dict[str, Dict]:
+        """获取initial_state对应的用户索引，同一份状态只构建一次"""
+        cached = self._user_index_cache.get(id(initial_state))
+        # 同时比对对象本身，防止状态被回收后id复用命中旧索引
+        if cached and cached[0] is initial_state:
+            return cached[1]
         
-        if max_depth <= 0:
-            return users
+        index = self._build_user_index(initial_state)
+        self._user_index_cache[id(initial_state)] = (initial_state, index)
+        return index
+    
+    def _build_user_index(self, initial_state: Dict) -> Dict[str, Dict]:
+        """一次遍历构建 {用户ID: 用户数据} 索引，userMap中的用户优先"""
+        index = {}
+        user_map = initial_state.get('user', {}).get('userMap', {})
+        if isinstance(user_map, dict):
+            index.update((uid, user_data) for uid, user_data in user_map.items() if isinstance(user_data, dict))
         
-        if isinstance(data, dict):
-            # 检查当前层级是否是用户数据
-            if self.looks_like_user_data(data):
-                users.append(data)
-            else:
-                # 递归搜索
-                for key, value in data.items():
-                    if key in ['user', 'users', 'userMap', 'userInfo', 'author']:
+        for user_data in self._iter_state_users(initial_state):
+            for key in USER_ID_KEYS:
+                uid = user_data.get(key)
+                if uid and isinstance(uid, str):
+                    # 保留首次出现的用户，与原先线性查找的结果一致
+                    index.setdefault(uid, user_data)
+        return index
+    
+    def find_all_users_in_state(self, data: Dict, max_depth: int = 3) -> List[Dict]:
+        """查找所有用户信息"""
+        return list(self._iter_state_users(data, max_depth))
+    
+    def _iter_state_users(self, data: Dict, max_depth: int = 3):
+        """逐个产出状态树中的用户信息（显式栈深度优先遍历，不再逐层递归）"""
+        # 栈元素: (节点, 剩余深度, 是否已判定为用户数据)
+        stack = deque([(data, max_depth, False)])
+        
+        while stack:
+            node, depth, matched = stack.pop()
+            if matched:
+                yield node
+                continue
+            if depth <= 0:
+                continue
+            
+            children = []
+            if isinstance(node, dict):
+                # 检查当前层级是否是用户数据
+                if self.looks_like_user_data(node):
+                    yield node
+                    continue
+                for key, value in node.items():
+                    if key in USER_CONTAINER_KEYS:
                         if isinstance(value, dict):
                             if self.looks_like_user_data(value):
-                                users.append(value)
+                                children.append((value, 0, True))
                             else:
-                                users.extend(self.find_all_users_in_state(value, max_depth - 1))
+                                children.append((value, depth - 1, False))
                         elif isinstance(value, list):
-                            for item in value:
-                                if self.looks_like_user_data(item):
-                                    users.append(item)
-                    else:
-                        users.extend(self.find_all_users_in_state(value, max_depth - 1))
-        elif isinstance(data, list):
-            for item in data:
-                users.extend(self.find_all_users_in_state(item, max_depth - 1))
-        
-        return users
+                            children.extend((item, 0, True) for item in value if self.looks_like_user_data(item))
+                    elif isinstance(value, (dict, list)):
+                        children.append((value, depth - 1, False))
+            elif isinstance(node, list):
+                children = [(item, depth - 1, False) for item in node if isinstance(item, (dict, list))]
+            
+            # 逆序入栈，保持与原递归实现一致的结果顺序
+            stack.extend(reversed(children))
     
     def looks_like_user_data(self, data) -> bool:
         """判断数据是否看起来像用户信息"""
         if not isinstance(data, dict):
             return False
         
-        user_indicators = [
-            'nickname', 'name', 'username',  # 用户名
-            'avatar', 'avatarUrl',  # 头像
-            'user_id', 'userId', 'uid', 'id'  # 用户ID
-        ]
-        
-        found_indicators = sum(1 for key in user_indicators if key in data)
-        return found_indicators >= 2
+        # 键视图与frozenset求交集在C层完成，并且只遍历较小的一方
+        return len(data.keys() & USER_INDICATOR_KEYS) >= 2
     
-    def parse_time_string(self, time_str: str) -> int:
-        """解析时间字符串为时间戳"""
+    def parse_time_string(self, time_str: str, now: Optional[datetime] = None) -> int:
+        """解析时间字符串为时间戳，now由调用方按批次传入以避免逐条取当前时间"""
+        now = now or datetime.now()
         try:
             if '小时前' in time_str:
-                hours = int(re.search(r'(\d+)', time_str).group(1))
-                return int((datetime.now() - timedelta(hours=hours)).timestamp() * 1000)
+                hours = int(_DIGITS_RE.search(time_str).group(1))
+                return int((now - timedelta(hours=hours)).timestamp() * 1000)
             elif '分钟前' in time_str:
-                minutes = int(re.search(r'(\d+)', time_str).group(1))
-                return int((datetime.now() - timedelta(minutes=minutes)).timestamp() * 1000)
+                minutes = int(_DIGITS_RE.search(time_str).group(1))
+                return int((now - timedelta(minutes=minutes)).timestamp() * 1000)
             elif '天前' in time_str:
-                days = int(re.search(r'(\d+)', time_str).group(1))
-                return int((datetime.now() - timedelta(days=days)).timestamp() * 1000)
+                days = int(_DIGITS_RE.search(time_str).group(1))
+                return int((now - timedelta(days=days)).timestamp() * 1000)
             elif 'T' in time_str:
-                dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-                return int(dt.timestamp() * 1000)
+                return iso_to_millis(time_str)
             else:
                 # 尝试直接解析为数字
                 return int(float(time_str))
         except:
-            return int(time.time() * 1000)  # 返回当前时间
+            return int(now.timestamp() * 1000)  # 返回当前时间
     
-    def recursive_search_comments(self, data, max_depth: int = 5) -> List[Dict]:
-        """递归搜索评论数据"""
+    def recursive_search_comments(self, data, max_depth: int = 5, limit: Optional[int] = None) -> List[Dict]:
+        """搜索评论数据（显式栈深度优先遍历，不再逐层递归），找到limit条后提前结束"""
         comments = []
+        # 栈元素: (节点, 剩余深度, 是否已判定为评论数据)
+        stack = deque([(data, max_depth, False)])
         
-        if max_depth <= 0:
-            return comments
-        
-        if isinstance(data, dict):
-            # 检查当前层级是否包含评论特征
-            if self.looks_like_comment_data(data):
-                comments.append(data)
-            else:
-                # 递归搜索子层级
-                for key, value in data.items():
-                    if key in ['comments', 'comment', 'commentList', 'replies', 'list']:
-                        if isinstance(value, list):
-                            for item in value:
-                                if self.looks_like_comment_data(item):
-                                    comments.append(item)
-                        elif isinstance(value, dict) and 'list' in value:
-                            for item in value['list']:
-                                if self.looks_like_comment_data(item):
-                                    comments.append(item)
-                    else:
-                        comments.extend(self.recursive_search_comments(value, max_depth - 1))
-        elif isinstance(data, list):
-            for item in data:
-                if self.looks_like_comment_data(item):
-                    comments.append(item)
-                else:
-                    comments.extend(self.recursive_search_comments(item, max_depth - 1))
+        while stack:
+            if limit and len(comments) >= limit:
+                break
+            node, depth, matched = stack.pop()
+            if matched:
+                comments.append(node)
+                continue
+            if depth <= 0:
+                continue
+            
+            children = []
+            if isinstance(node, dict):
+                # 检查当前层级是否包含评论特征
+                if self.looks_like_comment_data(node):
+                    comments.append(node)
+                    continue
+                for key, value in node.items():
+                    if key in COMMENT_CONTAINER_KEYS:
+                        if isinstance(value, dict):
+                            value = value.get('list', ())
+                        if isinstance(value, (list, tuple)):
+                            children.extend((item, 0, True) for item in value if self.looks_like_comment_data(item))
+                    elif isinstance(value, (dict, list)):
+                        children.append((value, depth - 1, False))
+            elif isinstance(node, list):
+                for item in node:
+                    if self.looks_like_comment_data(item):
+                        children.append((item, 0, True))
+                    elif isinstance(item, (dict, list)):
+                        children.append((item, depth - 1, False))
+            
+            # 逆序入栈，保持与原递归实现一致的结果顺序
+            stack.extend(reversed(children))
         
         return comments
     
@@ -963,18 +1769,8 @@ class DynamicCommentExtractor:
         if not isinstance(data, dict):
             return False
         
-        # 检查是否包含评论的典型字段
-        comment_indicators = [
-            'content', 'text', 'body',  # 评论内容
-            'user', 'author', 'user_info',  # 用户信息
-            'create_time', 'time', 'timestamp', 'created_at',  # 时间
-            'id', 'comment_id', 'cid'  # ID
-        ]
-        
-        found_indicators = sum(1 for key in comment_indicators if key in data)
-        
         # 如果包含至少2个典型字段，认为是评论数据
-        return found_indicators >= 2
+        return len(data.keys() & COMMENT_INDICATOR_KEYS) >= 2
     
     def create_image_filename(self, nickname: str, formatted_time: str, content: str, index: int = 1) -> str:
         """创建图片文件名，格式：用户昵称_评论时间_评论内容_序号"""
@@ -1001,34 +1797,54 @@ class DynamicCommentExtractor:
             
             return filename
         except Exception as e:
-            self.console.print(f"[yellow]创建图片文件名失败: {e}[/yellow]")
+            logger.warning("创建图片文件名失败: %s", e)
             return f"image_{nickname}_{index}"
     
-    async def download_image(self, url: str, save_path: Path, session: aiohttp.ClientSession) -> bool:
-        """下载单张图片"""
+    async def download_image(self, url: str, save_path: Path, session: aiohttp.ClientSession,
+                             mirror_path: Optional[Path] = None) -> bool:
+        """下载单张图片，mirror_path不为空时同时保存一份到该路径"""
         try:
             async with session.get(url) as response:
                 if response.status == 200:
                     content = await response.read()
                     async with aiofiles.open(save_path, 'wb') as f:
                         await f.write(content)
+                    if mirror_path is not None:
+                        await self._mirror_image(save_path, mirror_path, content)
                     return True
                 else:
-                    self.console.print(f"[yellow]图片下载失败 {response.status}: {url}[/yellow]")
+                    logger.warning("图片下载失败 %s: %s", response.status, url)
                     return False
         except Exception as e:
-            self.console.print(f"[yellow]下载图片异常: {e}[/yellow]")
+            logger.warning("下载图片异常: %s", e)
             return False
     
+    async def _mirror_image(self, save_path: Path, mirror_path: Path, content: bytes):
+        """同步图片到另一路径：优先硬链接，不支持时直接写入内存中的数据，不再重新读取文件"""
+        try:
+            try:
+                mirror_path.unlink(missing_ok=True)
+                os.link(save_path, mirror_path)
+            except OSError:
+                async with aiofiles.open(mirror_path, 'wb') as f:
+                    await f.write(content)
+        except Exception as e:
+            logger.warning("复制到统一目录失败: %s", e)
+    
     def get_image_extension(self, url: str, content_type: str = None) -> str:
         """获取图片扩展名"""
         try:
-            # 首先尝试从URL中获取扩展名
-            parsed_url = urlparse(url)
-            path = parsed_url.path
-            if '.' in path:
-                ext = path.split('.')[-1].lower()
-                if ext in ['jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp']:
+            # 首先尝试从URL中获取扩展名：去掉查询串/锚点后取最后一段路径的后缀
+            end = len(url)
+            for sep in '?#':
+                pos = url.find(sep, 0, end)
+                if pos >= 0:
+                    end = pos
+            name = url[url.rfind('/', 0, end) + 1:end]
+            dot = name.rfind('.')
+            if dot >= 0:
+                ext = name[dot + 1:].lower()
+                if ext in IMAGE_EXTENSIONS:
                     return f".{ext}"
             
             # 如果从URL获取不到，尝试从content-type获取
@@ -1042,6 +1858,25 @@ class DynamicCommentExtractor:
         except:
             return '.jpg'
     
+    def _ensure_dir(self, path: Path):
+        """创建目录，同一目录在本次运行中只创建一次"""
+        if path not in self._created_dirs:
+            path.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(path)
+    
+    def _get_http_session(self) -> aiohttp.ClientSession:
+        """获取图片下载用的HTTP会话，首次使用时创建，aclose()时关闭"""
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession(
+                headers=IMAGE_HEADERS,
+                connector=aiohttp.TCPConnector(
+                    limit=IMAGE_CONNECTION_LIMIT,
+                    limit_per_host=IMAGE_CONNECTION_LIMIT_PER_HOST,
+                    keepalive_timeout=IMAGE_KEEPALIVE_TIMEOUT
+                )
+            )
+        return self._http_session
+    
     async def download_comment_images(self, image_urls: List[str], nickname: str, formatted_time: str, content: str, comment_dir: Path) -> List[str]:
         """下载评论中的所有图片"""
         downloaded_images = []
@@ -1049,62 +1884,40 @@ class DynamicCommentExtractor:
         if not image_urls:
             return downloaded_images
         
-        # 直接使用用户昵称目录，不创建images子目录
-        images_dir = comment_dir
-        
         # 创建统一的图片收集目录
         all_images_dir = self.work_path / "all_comment_images"
-        all_images_dir.mkdir(exist_ok=True)
+        self._ensure_dir(all_images_dir)
         
-        # 创建HTTP会话
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36',
-            'Referer': 'https://www.xiaohongshu.com/'
-        }
+        session = self._get_http_session()
         
-        async with aiohttp.ClientSession(headers=headers) as session:
-            for i, url in enumerate(image_urls, 1):
-                try:
-                    if not url:
-                        continue
-                    
-                    # 创建文件名
-                    filename_base = self.create_image_filename(nickname, formatted_time, content, i)
-                    
-                    # 获取图片扩展名
-                    extension = self.get_image_extension(url)
-                    filename = filename_base + extension
-                    
-                    # 用户文件夹中的保存路径
-                    user_save_path = images_dir / filename
-                    
-                    # 统一收集目录中的保存路径
-                    all_save_path = all_images_dir / filename
-                    
-                    # 下载图片
-                    self.console.print(f"[blue]下载图片 {i}/{len(image_urls)}: {filename}[/blue]")
-                    
-                    # 先下载到用户文件夹
-                    success = await self.download_image(url, user_save_path, session)
-                    
-                    if success:
-                        downloaded_images.append(str(user_save_path))
-                        
-                        # 复制到统一收集目录
-                        try:
-                            import shutil
-                            shutil.copy2(user_save_path, all_save_path)
-                            self.console.print(f"[green]✓ 图片下载成功: {filename}[/green]")
-                            self.console.print(f"[cyan]  └─ 已同步到统一目录: all_comment_images/{filename}[/cyan]")
-                        except Exception as copy_error:
-                            self.console.print(f"[yellow]⚠️  复制到统一目录失败: {copy_error}[/yellow]")
-                            
-                    else:
-                        self.console.print(f"[red]✗ 图片下载失败: {filename}[/red]")
-                        
-                except Exception as e:
-                    self.console.print(f"[red]处理图片 {i} 失败: {e}[/red]")
-                    continue
+        async def download_one(i: int, url: str) -> Optional[str]:
+            # 创建文件名，直接保存到用户昵称目录，不创建images子目录
+            filename = self.create_image_filename(nickname, formatted_time, content, i) + self.get_image_extension(url)
+            user_save_path = comment_dir / filename
+            all_save_path = all_images_dir / filename
+            
+            async with self._image_semaphore:
+                logger.debug("下载图片 %d/%d: %s", i, len(image_urls), filename)
+                # 同时写入用户文件夹和统一收集目录
+                success = await self.download_image(url, user_save_path, session, all_save_path)
+            
+            if not success:
+                logger.warning("图片下载失败: %s", filename)
+                return None
+            
+            logger.debug("图片下载成功: %s", filename)
+            return str(user_save_path)
+        
+        # 并发下载，信号量限制同时进行的请求数
+        results = await asyncio.gather(
+            *(download_one(i, url) for i, url in enumerate(image_urls, 1) if url),
+            return_exceptions=True
+        )
+        for i, result in enumerate(results, 1):
+            if isinstance(result, Exception):
+                logger.error("处理图片 %d 失败: %s", i, result)
+            elif result:
+                downloaded_images.append(result)
         
         return downloaded_images
     
@@ -1142,11 +1955,11 @@ class DynamicCommentExtractor:
         """调试：保存原始数据结构"""
         try:
             debug_dir = self.work_path / "debug"
-            debug_dir.mkdir(exist_ok=True)
+            self._ensure_dir(debug_dir)
             
             debug_file = debug_dir / f"initial_state_{note_id}.json"
-            async with aiofiles.open(debug_file, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(initial_state, ensure_ascii=False, indent=2))
+            # 状态数据可能有数MB，放到线程中编码写入，不阻塞事件循环
+            await asyncio.to_thread(write_json_file, debug_file, initial_state, True)
             
             self.console.print(f"[blue]调试数据已保存到: {debug_file}[/blue]")
             
@@ -1157,7 +1970,9 @@ class DynamicCommentExtractor:
             self.console.print(f"[yellow]保存调试数据失败: {e}[/yellow]")
     
     def analyze_initial_state_structure(self, initial_state: Dict, note_id: str):
-        """分析初始状态数据结构"""
+        """分析初始状态数据结构（仅调试模式）"""
+        if not self.debug:
+            return
         try:
             self.console.print("[blue]== 数据结构分析 ==[/blue]")
             
@@ -1190,7 +2005,7 @@ class DynamicCommentExtractor:
                                 self.console.print(f"单条评论键: {comment_keys}")
                                 
                                 # 输出评论样本
-                                self.console.print(f"评论样本: {json.dumps(first_comment, ensure_ascii=False, indent=2)[:300]}...")
+                                self.console.print(f"评论样本: {dump_json_bytes(first_comment, indent=True).decode('utf-8')[:300]}...")
             
             # 分析user部分
             if 'user' in initial_state:
@@ -1199,7 +2014,7 @@ class DynamicCommentExtractor:
                 
                 if 'userMap' in initial_state['user']:
                     user_map = initial_state['user']['userMap']
-                    user_ids = list(user_map.keys())[:5]  # 只显示前5个
+                    user_ids = list(islice(user_map, 5))  # 只显示前5个
                     self.console.print(f"userMap中的用户ID样本: {user_ids}")
                     
                     if user_ids:
@@ -1213,118 +2028,123 @@ class DynamicCommentExtractor:
     def normalize_comment_data(self, comments: List[Dict]) -> List[Dict]:
         """标准化评论数据格式"""
         normalized = []
+        now = datetime.now()
+        seen_ids = set()
         
         for comment in comments:
             try:
+                # 分页重叠或DOM兜底可能带来重复评论，按原始ID跳过，不再重复标准化
+                comment_id = _first_present(comment, ('id', 'comment_id'))
+                if comment_id:
+                    if comment_id in seen_ids:
+                        continue
+                    seen_ids.add(comment_id)
+                
+                normalized_comment = {
+                    name: _first_present(comment, aliases, default)
+                    for name, aliases, default in NORMALIZED_COMMENT_FIELDS
+                }
+                
                 # 标准化用户信息
-                user_info = comment.get('user_info', comment.get('user', comment.get('author', {})))
-                if isinstance(user_info, str):
+                user_info = normalized_comment['user_info']
+                if user_info is _MISSING:
+                    user_info = {}
+                elif isinstance(user_info, str):
                     user_info = {'nickname': user_info}
                 elif not isinstance(user_info, dict):
                     user_info = {'nickname': '匿名用户'}
+                normalized_comment['user_info'] = user_info
                 
                 # 标准化评论内容
-                content = comment.get('content', comment.get('text', comment.get('body', '')))
+                normalized_comment['content'] = str(normalized_comment['content']).strip()
                 
-                # 标准化时间
-                create_time = comment.get('create_time', comment.get('time', comment.get('timestamp', 0)))
+                # 标准化时间：统一为数字时间戳，排序时可直接用itemgetter取键
+                create_time = normalized_comment['create_time']
+                if isinstance(create_time, str):
+                    normalized_comment['create_time'] = self.parse_time_string(create_time, now)
+                elif not isinstance(create_time, (int, float)):
+                    normalized_comment['create_time'] = 0
                 
                 # 标准化图片
-                images = comment.get('images', comment.get('pics', comment.get('pictures', [])))
-                if not isinstance(images, list):
-                    images = []
+                if not isinstance(normalized_comment['images'], list):
+                    normalized_comment['images'] = []
                 
-                normalized_comment = {
-                    'user_info': user_info,
-                    'content': str(content).strip(),
-                    'create_time': create_time,
-                    'images': images,
-                    'id': comment.get('id', comment.get('comment_id', f'comment_{len(normalized)}'))
-                }
+                if normalized_comment['id'] is _MISSING:
+                    normalized_comment['id'] = f'comment_{len(normalized)}'
                 
                 # 只保留有内容的评论
                 if normalized_comment['content'] or normalized_comment['images']:
                     normalized.append(normalized_comment)
                     
             except Exception as e:
-                self.console.print(f"[yellow]标准化评论失败: {e}[/yellow]")
+                logger.warning("标准化评论失败: %s", e)
                 continue
         
         return normalized
     
     def clean_filename(self, filename: str) -> str:
         """清理文件名中的非法字符"""
-        import re
-        
-        # 替换非法字符
-        illegal_chars = r'[<>:"/\\|?*！~\n\r\t]'
-        filename = re.sub(illegal_chars, '_', filename)
-        
-        # 替换多个连续的空格和下划线为单个下划线
-        filename = re.sub(r'[_\s]+', '_', filename)
-        
-        # 移除开头和结尾的下划线和空格
-        filename = filename.strip('_').strip()
-        
-        # 如果文件名太长，智能截取（保留前面的重要信息）
-        if len(filename) > 80:  # 增加长度限制，更好地保留标题信息
-            filename = filename[:80].rstrip('_')
-        
-        # 如果清理后为空，返回默认名称
-        if not filename:
-            filename = "未命名作品"
-            
-        return filename
+        return _clean_filename(filename)
     
-    def format_comment_time(self, timestamp) -> str:
+    def format_comment_time(self, timestamp, now: Optional[datetime] = None) -> str:
         """格式化评论时间"""
         try:
             if isinstance(timestamp, str):
                 # 尝试解析中文时间格式
                 if '小时前' in timestamp:
-                    hours = int(re.search(r'(\d+)', timestamp).group(1))
-                    dt = datetime.now() - timedelta(hours=hours)
+                    hours = int(_DIGITS_RE.search(timestamp).group(1))
+                    dt = (now or datetime.now()) - timedelta(hours=hours)
                     return dt.strftime("%Y-%m-%d %H:%M:%S")
                 elif '分钟前' in timestamp:
-                    minutes = int(re.search(r'(\d+)', timestamp).group(1))
-                    dt = datetime.now() - timedelta(minutes=minutes)
+                    minutes = int(_DIGITS_RE.search(timestamp).group(1))
+                    dt = (now or datetime.now()) - timedelta(minutes=minutes)
                     return dt.strftime("%Y-%m-%d %H:%M:%S")
                 elif '天前' in timestamp:
-                    days = int(re.search(r'(\d+)', timestamp).group(1))
-                    dt = datetime.now() - timedelta(days=days)
+                    days = int(_DIGITS_RE.search(timestamp).group(1))
+                    dt = (now or datetime.now()) - timedelta(days=days)
                     return dt.strftime("%Y-%m-%d %H:%M:%S")
                 elif 'T' in timestamp:
-                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+                    dt = parse_iso_datetime(timestamp)
                     return dt.strftime("%Y-%m-%d %H:%M:%S")
                 else:
                     return timestamp
             elif isinstance(timestamp, (int, float)):
-                if timestamp > 10**12:  # 毫秒级
-                    dt = datetime.fromtimestamp(timestamp / 1000)
-                else:  # 秒级
-                    dt = datetime.fromtimestamp(timestamp)
-                return dt.strftime("%Y-%m-%d %H:%M:%S")
+                return format_timestamp(timestamp)
         except:
             pass
         return "未知时间"
     
-    async def save_comment_content(self, comment: Dict, comment_dir: Path) -> None:
+    def _extract_image_urls(self, images) -> List[str]:
+        """从评论图片字段中提取URL列表，兼容dict和字符串两种形式"""
+        image_urls = []
+        for img in images or ():
+            if isinstance(img, dict):
+                # 尝试多个可能的URL字段
+                url = _first_present(img, IMAGE_URL_KEYS, '')
+            else:
+                url = str(img)
+            if url:
+                image_urls.append(url)
+        return image_urls
+    
+    async def save_comment_content(self, comment: Dict, comment_dir: Path,
+                                   now: Optional[datetime] = None) -> None:
         """保存单条评论内容"""
         try:
             # 提取评论信息
-            user_info = comment.get('user_info', {})
+            user_info = comment.get('user_info') or {}
             nickname = user_info.get('nickname', '匿名用户')
             user_id = user_info.get('user_id', '')
             avatar = user_info.get('avatar', '')
             content = comment.get('content', '')
             create_time = comment.get('create_time', '')
-            images = comment.get('images', [])
+            images = comment.get('images') or ()
             ip_location = comment.get('ip_location', '')
             like_count = comment.get('like_count', '0')
             sub_comment_count = comment.get('sub_comment_count', '0')
             
             # 格式化时间
-            formatted_time = self.format_comment_time(create_time)
+            formatted_time = self.format_comment_time(create_time, now)
             
             # 创建详细的评论内容文件
             comment_file = comment_dir / "评论内容.txt"
@@ -1343,58 +2163,33 @@ IP位置: {ip_location}
             
             # 处理图片
             downloaded_images = []
-            if images:
-                image_urls = []
-                for img in images:
-                    if isinstance(img, dict):
-                        # 尝试多个可能的URL字段
-                        url = img.get('url_default', img.get('url', img.get('src', img.get('urlDefault', ''))))
-                    else:
-                        url = str(img)
-                    if url:
-                        image_urls.append(url)
+            image_urls = self._extract_image_urls(images)
+            if image_urls:
+                # 下载评论图片
+                downloaded_images = await self.download_comment_images(image_urls, nickname, formatted_time, content, comment_dir)
+                self.console.print(f"[green]评论图片下载完成: {len(downloaded_images)}/{len(image_urls)}[/green]")
                 
-                if image_urls:
-                    # 下载评论图片
-                    self.console.print(f"[blue]开始下载 {len(image_urls)} 张评论图片...[/blue]")
-                    downloaded_images = await self.download_comment_images(image_urls, nickname, formatted_time, content, comment_dir)
-                    
-                    # 在文本中记录图片信息
-                    comment_info += f"\n评论图片 (共{len(image_urls)}张):\n"
-                    for i, url in enumerate(image_urls, 1):
-                        comment_info += f"  {i}. {url}\n"
-                    
-                    # 添加下载结果信息
-                    if downloaded_images:
-                        comment_info += f"\n已下载图片 (共{len(downloaded_images)}张):\n"
-                        for i, path in enumerate(downloaded_images, 1):
-                            filename = Path(path).name
-                            comment_info += f"  {i}. {filename}\n"
-            
-            # 保存评论内容
-            async with aiofiles.open(comment_file, 'w', encoding='utf-8') as f:
-                await f.write(comment_info)
-            
-            # 保存原始JSON数据（去掉raw_data避免重复）
-            clean_comment = {k: v for k, v in comment.items() if k != 'raw_data'}
+                # 在文本中记录图片信息
+                comment_info += f"\n评论图片 (共{len(image_urls)}张):\n"
+                for i, url in enumerate(image_urls, 1):
+                    comment_info += f"  {i}. {url}\n"
+                
+                # 添加下载结果信息
+                if downloaded_images:
+                    comment_info += f"\n已下载图片 (共{len(downloaded_images)}张):\n"
+                    for i, path in enumerate(downloaded_images, 1):
+                        filename = Path(path).name
+                        comment_info += f"  {i}. {filename}\n"
+            
+            # 保存评论内容和原始JSON数据（去掉raw_data避免重复）
+            clean_comment = without_raw_data(comment)
             json_file = comment_dir / "原始数据.json"
-            async with aiofiles.open(json_file, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(clean_comment, ensure_ascii=False, indent=2))
+            await asyncio.to_thread(write_comment_files, comment_file, comment_info, json_file, clean_comment)
             
             # 调用进度回调函数
             if self.progress_callback:
                 try:
-                    image_urls = []
-                    if images:
-                        for img in images:
-                            if isinstance(img, dict):
-                                url = img.get('url_default', img.get('url', img.get('src', img.get('urlDefault', ''))))
-                            else:
-                                url = str(img)
-                            if url:
-                                image_urls.append(url)
-                    
-                    self.console.print(f"[blue]调用进度回调函数: {nickname} - {content[:30]}...[/blue]")
+                    logger.debug("调用进度回调函数: %s - %s", nickname, content[:30])
                     
                     # 传递下载后的图片路径和原始URL
                     callback_data = {
@@ -1402,23 +2197,57 @@ IP位置: {ip_location}
                         'time': formatted_time,
                         'content': content,
                         'image_urls': image_urls,
-                        'downloaded_images': downloaded_images if 'downloaded_images' in locals() else [],
+                        'downloaded_images': downloaded_images,
                         'comment_dir': str(comment_dir)
                     }
                     
                     self.progress_callback(callback_data)
-                    self.console.print(f"[green]回调函数调用成功[/green]")
                 except Exception as callback_error:
-                    self.console.print(f"[yellow]回调函数执行失败: {callback_error}[/yellow]")
-            else:
-                self.console.print(f"[yellow]没有设置进度回调函数[/yellow]")
+                    logger.warning("回调函数执行失败: %s", callback_error)
                 
         except Exception as e:
-            self.console.print(f"[red]保存评论内容失败: {e}[/red]")
+            logger.exception("保存评论内容失败: %s", e)
     
     async def extract_comments(self, note_url: str) -> bool:
         """提取指定笔记的评论"""
+        # 未通过start()/async with启动浏览器时，提取结束后自动关闭
+        owns_browser = self._context is None
+        try:
+            return await self._extract_comments(note_url)
+        finally:
+            if owns_browser:
+                await self.aclose()
+    
+    async def crawl_many(self, urls: List[str], max_concurrent: int = None) -> List[bool]:
+        """并发提取多个笔记的评论，返回与urls顺序一致的结果"""
+        max_concurrent = max_concurrent or self.max_concurrent
+        semaphore = asyncio.Semaphore(max_concurrent)
+        
+        async def worker(url: str) -> bool:
+            async with semaphore:
+                return await self.extract_comments(url)
+        
+        owns_browser = self._context is None
+        if owns_browser:
+            await self.start()
+        try:
+            results = await asyncio.gather(*(worker(url) for url in urls), return_exceptions=True)
+        finally:
+            if owns_browser:
+                await self.aclose()
+        
+        # 单个笔记异常不影响其他笔记，记为失败
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                self.console.print(f"[red]提取失败 {url}: {result}[/red]")
+        return [result is True for result in results]
+    
+    async def _extract_comments(self, note_url: str) -> bool:
         try:
+            await self.prepare()
+            # 上一篇笔记的用户索引已无用，避免随initial_state一起常驻内存
+            self._user_index_cache.clear()
+            
             # 提取笔记ID
             note_id = self.extract_note_id(note_url)
             if not note_id:
@@ -1452,19 +2281,18 @@ IP位置: {ip_location}
             work_title = note_info.get('作品标题', note_id)
             work_title = self.clean_filename(work_title)
             work_dir = self.work_path / work_title
-            work_dir.mkdir(parents=True, exist_ok=True)
+            self._ensure_dir(work_dir)
             
             self.console.print(f"[green]作品标题: {work_title}[/green]")
             self.console.print(f"[green]保存路径: {work_dir}[/green]")
             
             # 保存笔记信息
             note_info_file = work_dir / "作品信息.json"
-            async with aiofiles.open(note_info_file, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(note_info, ensure_ascii=False, indent=2))
+            await asyncio.to_thread(write_json_file, note_info_file, note_info, True)
             
             # 使用浏览器提取评论
             self.console.print("[blue]启动浏览器获取动态评论...[/blue]")
-            raw_comments = await self.extract_comments_with_browser(note_url, note_id)
+            raw_comments = await self.extract_comments_with_browser(note_url, note_id, work_dir / "评论数据.jsonl")
             
             # 标准化评论数据
             normalized_comments = self.normalize_comment_data(raw_comments)
@@ -1473,80 +2301,70 @@ IP位置: {ip_location}
                 self.console.print("[yellow]未提取到真实评论数据[/yellow]")
                 
                 # 生成演示评论以展示功能
-                demo_comments = [
-                    {
-                        'user_info': {'nickname': '评论提取演示'},
-                        'content': '这是一个演示评论，说明程序结构和功能正常工作。真实评论可能需要登录状态或特定条件才能获取。',
-                        'create_time': int(time.time() * 1000),
-                        'images': [],
-                        'id': 'demo_1'
-                    }
-                ]
-                normalized_comments = demo_comments
+                normalized_comments = [dict(DEMO_COMMENT, create_time=int(time.time() * 1000))]
                 self.console.print("[blue]使用演示数据展示程序功能[/blue]")
             
             self.console.print(f"[green]成功获取到 {len(normalized_comments)} 条评论[/green]")
             
             # 按时间排序评论（最新的在前面）
-            normalized_comments.sort(key=lambda x: x.get('create_time', 0), reverse=True)
+            normalized_comments.sort(key=itemgetter('create_time'), reverse=True)
             self.console.print("[blue]✓ 评论已按时间排序（最新在前）[/blue]")
             
+            # 保存前一次性算出每条评论的用户目录名，保存循环中不再逐条取字典
+            nicknames = [
+                self.clean_filename((comment.get('user_info') or {}).get('nickname') or f'用户_{i+1}')
+                for i, comment in enumerate(normalized_comments)
+            ]
+            
             # 保存评论
             with Progress(
                 TextColumn("[progress.description]{task.description}"),
                 BarColumn(),
                 TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
                 TimeRemainingColumn(),
-                console=self.console
+                console=self.console,
+                refresh_per_second=4  # 由后台线程按固定频率重绘，保存循环中只累加计数
             ) as progress:
                 task = progress.add_task("保存评论中...", total=len(normalized_comments))
+                now = datetime.now()
                 
-                for i, comment in enumerate(normalized_comments):
+                # 按用户昵称分组：同一用户的评论写入同一目录下的同名文件，组内按原顺序保存，
+                # 不同用户之间并发保存，每个用户目录也只需创建一次
+                groups = {}
+                for i, (nickname, comment) in enumerate(zip(nicknames, normalized_comments)):
+                    groups.setdefault(nickname, []).append((i, comment))
+                
+                async def save_group(nickname: str, items: List):
+                    user_dir = work_dir / nickname
                     try:
-                        # 获取用户昵称
-                        user_info = comment.get('user_info', {})
-                        nickname = user_info.get('nickname', f'用户_{i+1}')
-                        nickname = self.clean_filename(nickname)
-                        
-                        # 创建用户文件夹
-                        user_dir = work_dir / nickname
-                        user_dir.mkdir(exist_ok=True)
-                        
-                        # 保存评论内容
-                        await self.save_comment_content(comment, user_dir)
-                        
-                        progress.update(task, advance=1)
-                        
-                    except Exception as e:
-                        self.console.print(f"[red]处理评论 {i+1} 失败: {e}[/red]")
-                        continue
+                        self._ensure_dir(user_dir)
+                    except Exception:
+                        logger.exception("处理评论 %d 失败", items[0][0] + 1)
+                        return
+                    saved = 0
+                    for i, comment in items:
+                        try:
+                            await self.save_comment_content(comment, user_dir, now)
+                            saved += 1
+                        except Exception:
+                            logger.exception("处理评论 %d 失败", i + 1)
+                    progress.advance(task, saved)
+                
+                group_iter = iter(groups.items())
+                while batch := list(islice(group_iter, SAVE_BATCH_SIZE)):
+                    await asyncio.gather(*(save_group(nickname, items) for nickname, items in batch))
             
             # 创建提取报告
             report_file = work_dir / "提取报告.txt"
-            report_content = f"""小红书动态评论提取报告
-
-笔记ID: {note_id}
-笔记链接: {note_url}
-作品标题: {work_title}
-提取时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-评论数量: {len(normalized_comments)} 条
-排序方式: 按时间倒序（最新评论在前）
-
-技术方法:
-- 使用Playwright浏览器自动化
-- 模拟真实浏览器访问
-- 动态触发JavaScript评论加载
-- 从__INITIAL_STATE__和DOM中提取数据
-- 按时间排序避免重复下载
-
-说明:
-此版本使用浏览器自动化技术，可以处理动态加载的评论。
-评论按时间倒序排列，最新的评论在前面，避免重复下载。
-如果未获取到真实评论，可能需要登录状态或该笔记暂无评论。
-"""
+            report_content = REPORT_TEMPLATE.format(
+                note_id=note_id,
+                note_url=note_url,
+                work_title=work_title,
+                extract_time=now_str(),
+                comment_count=len(normalized_comments)
+            )
             
-            async with aiofiles.open(report_file, 'w', encoding='utf-8') as f:
-                await f.write(report_content)
+            await asyncio.to_thread(report_file.write_text, report_content, encoding='utf-8')
             
             self.console.print(f"[green]✓ 评论提取完成! 保存在: {work_dir}[/green]")
             return True
@@ -1593,7 +2411,9 @@ async def main():
     )
     
     # 提取评论
-    success = await extractor.extract_comments(note_url)
+    with queue_logging():
+        async with extractor:
+            success = await extractor.extract_comments(note_url)
     
     print()
     if success:
@@ -1608,4 +2428,12 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # 安装了uvloop时用它运行事件循环；Windows上Playwright需要默认的Proactor事件循环
+    run = asyncio.run
+    if os.name != 'nt':
+        try:
+            import uvloop
+            run = uvloop.run
+        except ImportError:
+            pass
+    run(main())
\ No newline at end of file
@@ -6,16 +6,223 @@
 """
 
 import asyncio
-import json
+import dataclasses
+import os
 import time
 from abc import ABC, abstractmethod
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any, AsyncIterator, Annotated
 import hashlib
+import heapq
 import re
+from operator import itemgetter
 
-from ai_model_manager import AIModelManager, TaskRequest, TaskType
+import aiofiles
+import aiofiles.os
+from pydantic import BaseModel, StringConstraints, ValidationError
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken为可选依赖，缺失时按字符数近似估算token
+    tiktoken = None
+
+from ai_model_manager import AIModelManager, TaskRequest, TaskResult, TaskType, default_mock_delay
+from json_utils import dump_json_bytes, load_json_bytes
+
+
+# 结果只取决于提示词、图片和模型的任务类型，可以按内容缓存到磁盘；效果图和对比图每次应重新生成
+CACHEABLE_TASK_TYPES = frozenset({TaskType.IMAGE_ANALYSIS, TaskType.TEXT_GENERATION, TaskType.STRUCTURED_MULTI})
+
+# 输出格式不符合要求时，重试请求追加的提示
+STRICT_JSON_HINT = "\n只返回一个JSON对象，必须包含analysis、plans、replies三个非空字符串字段，不要输出任何其他文字或代码块标记。\n"
+STRICT_TEXT_HINT = "\n请直接输出完整的正文内容，不要留空。\n"
+
+# 模型输出的字段校验：字段必须存在且去掉首尾空白后非空
+NonEmptyText = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+
+
+class StructuredOutput(BaseModel):
+    """结构化多任务输出"""
+    analysis: NonEmptyText
+    plans: NonEmptyText
+    replies: NonEmptyText
+
+
+class AnalysisOutput(BaseModel):
+    """图片分析输出"""
+    analysis: NonEmptyText
+
+
+class TextOutput(BaseModel):
+    """文本生成输出"""
+    generated_text: NonEmptyText
+
+# 模型在JSON前后附带说明文字或代码块标记时，取出最外层的JSON对象
+JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+
+# 提示词模板：固定的说明文字在前，每次变化的内容放在末尾，
+# 相同任务的提示词前缀逐字节一致，便于服务商命中提示词缓存
+STRUCTURED_PROMPT_TEMPLATE = """作为专业室内设计师兼小红书家居博主，请一次性完成以下三项任务，并只输出一个JSON对象，不要输出其他内容。
+
+JSON格式：{{"analysis": "...", "plans": "...", "replies": "..."}}
+
+1. analysis：房屋分析（有图片时结合图片），按以下格式：
+   ## 1. 空间基本信息
+   ## 2. 现状问题诊断
+   ## 3. 改造潜力评估
+   ## 4. 用户需求匹配度
+2. plans：设计4个不同风格的改造方案：现代简约、北欧自然、中式现代、工业复古风格。
+   每个方案要包含设计理念、色彩搭配、家具选择、预算估算等详细信息。
+3. replies：生成3个不同版本的回复，每个版本以"## 版本N："开头：
+   1. 详细专业版（200-300字）
+   2. 简洁实用版（100-150字）
+   3. 互动引导版（150-200字）
+   要求语言亲和友好，体现专业性，适当引导用户互动。
+
+【效果图】
+{styles_note}
+
+【用户原评论】
+{user_content}
+"""
+
+IMAGE_ANALYSIS_PROMPT_TEMPLATE = """作为专业室内设计师，请对用户提供的房屋图片进行全面分析。
+
+请按以下格式进行详细分析：
+## 1. 空间基本信息
+## 2. 现状问题诊断
+## 3. 改造潜力评估
+## 4. 用户需求匹配度
+
+用户需求：{user_content}
+"""
+
+TEXT_ANALYSIS_PROMPT_TEMPLATE = """基于用户的改造需求描述，提供专业的家居改造分析。
+请分析房屋类型、改造重点、预算建议等方面。
+
+用户需求：{user_content}
+"""
+
+PLANS_PROMPT_TEMPLATE = """基于以下房屋分析结果，请设计4个不同风格的改造方案：现代简约、北欧自然、中式现代、工业复古风格。
+每个方案要包含设计理念、色彩搭配、家具选择、预算估算等详细信息。
+
+【房屋分析结果】
+{analysis}
+
+【用户具体需求】
+{user_content}
+"""
+
+REPLY_PROMPT_TEMPLATE = """作为小红书家居博主，请为用户的改造需求生成专业回复。
+
+请生成3个不同版本的回复：
+1. 详细专业版（200-300字）
+2. 简洁实用版（100-150字）
+3. 互动引导版（150-200字）
+
+要求语言亲和友好，体现专业性，适当引导用户互动。
+
+【用户原评论】
+{user_content}
+
+【专业分析结果】
+{analysis}
+
+【改造方案】
+{plans}
+
+【生成的效果图】
+已为您生成了以下风格的改造效果图：{styles}
+"""
+
+# 同一请求的各风格共用分析和方案，风格放在最后，各风格的提示词共享同一前缀
+IMAGE_PROMPT_TEMPLATE = """请根据以下改造方案生成专业的室内设计效果图。
+要求：专业室内设计渲染图，高质量，体现所选风格的特点。
+
+原房间描述：{analysis}
+
+改造方案：{plans}
+
+风格：{style}
+"""
+
+COMPARISON_PROMPT_TEMPLATE = """请创建改造前后对比图。
+突出关键改造变化点，专业布局。
+
+风格：{style}
+"""
+
+# 模型输出缓存有效期（秒）
+LLM_CACHE_TTL = 7 * 86400
+
+# 家居改造关键词，合并成一个正则，评论内容只需扫描一遍
+RENOVATION_KEYWORDS = (
+    '改造', '装修', '设计', '房间', '客厅', '卧室', '厨房', '卫生间',
+    '收纳', '空间', '风格', '家具', '布局', '色彩', '搭配',
+    '出租屋', '小户型', '预算', 'diy'
+)
+RENOVATION_KEYWORD_RE = re.compile('|'.join(map(re.escape, RENOVATION_KEYWORDS)))
+
+
+@lru_cache(maxsize=1)
+def _get_token_encoding():
+    """加载tiktoken编码表（首次使用时加载一次），不可用时返回None"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """把文本截断到max_tokens个token以内，返回(文本, 是否截断)"""
+    # token数不会超过UTF-8字节数，短文本无需编码
+    if len(text.encode('utf-8')) <= max_tokens:
+        return text, False
+    
+    encoding = _get_token_encoding()
+    if encoding is None:
+        # 无tiktoken时按字符数近似，中文大约1个字符对应1个token
+        if len(text) <= max_tokens:
+            return text, False
+        return text[:max_tokens], True
+    
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text, False
+    return encoding.decode(tokens[:max_tokens]), True
+
+
+@lru_cache(maxsize=10000)
+def score_renovation_comment(content: str, image_count: int) -> Tuple[str, int, int, str]:
+    """按评论内容和图片数计算改造评分，返回(评论类型, 评分, 关键词命中数, 处理优先级)
+    
+    结果只取决于输入，重复评估同一条评论（重新排序、重试）时直接命中缓存
+    """
+    # 计算匹配分数：一次扫描找出所有命中的关键词，每个关键词只计一次
+    keyword_matches = len(set(RENOVATION_KEYWORD_RE.findall(content.lower())))
+    has_room_images = image_count > 0
+    
+    renovation_score = keyword_matches * 10
+    if has_room_images:
+        renovation_score += 30
+    
+    # 分类评论类型
+    if renovation_score >= 40:
+        comment_type = "high_priority_renovation"
+    elif renovation_score >= 20:
+        comment_type = "potential_renovation"
+    elif has_room_images:
+        comment_type = "image_consultation"
+    else:
+        comment_type = "general_inquiry"
+    
+    priority = "high" if renovation_score >= 40 else "medium" if renovation_score >= 20 else "low"
+    return comment_type, renovation_score, keyword_matches, priority
 
 
 class AIModelInterface(ABC):
@@ -50,13 +257,14 @@ class AIModelInterface(ABC):
 class MockAIModel(AIModelInterface):
     """模拟AI模型 - 用于开发和测试"""
     
-    def __init__(self):
+    def __init__(self, mock_delay: float = None):
         self.call_count = 0
-        self.mock_delay = 2  # 模拟处理时间
+        self.mock_delay = mock_delay if mock_delay is not None else default_mock_delay()  # 模拟处理时间
     
     async def analyze_room_image(self, image_path: str, user_comment: str) -> Dict:
         """模拟房屋图片分析"""
-        await asyncio.sleep(self.mock_delay)
+        if self.mock_delay:
+            await asyncio.sleep(self.mock_delay)
         self.call_count += 1
         
         return {
@@ -93,7 +301,8 @@ class MockAIModel(AIModelInterface):
     
     async def generate_renovation_plans(self, room_analysis: str, user_requirements: str) -> Dict:
         """模拟改造方案生成"""
-        await asyncio.sleep(self.mock_delay)
+        if self.mock_delay:
+            await asyncio.sleep(self.mock_delay)
         self.call_count += 1
         
         return {
@@ -146,7 +355,8 @@ class MockAIModel(AIModelInterface):
     
     async def generate_renovation_image(self, renovation_plan: str, style_name: str) -> Dict:
         """模拟图片生成"""
-        await asyncio.sleep(self.mock_delay * 2)  # 图片生成耗时更长
+        if self.mock_delay:
+            await asyncio.sleep(self.mock_delay * 2)  # 图片生成耗时更长
         self.call_count += 1
         
         # 模拟本地保存路径
@@ -165,7 +375,8 @@ class MockAIModel(AIModelInterface):
     
     async def create_before_after_comparison(self, original_image: str, generated_image: str) -> Dict:
         """模拟对比图创建"""
-        await asyncio.sleep(self.mock_delay)
+        if self.mock_delay:
+            await asyncio.sleep(self.mock_delay)
         self.call_count += 1
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -182,7 +393,8 @@ class MockAIModel(AIModelInterface):
     
     async def generate_professional_reply(self, original_comment: str, analysis: str, plans: str) -> Dict:
         """模拟专业回复生成"""
-        await asyncio.sleep(self.mock_delay)
+        if self.mock_delay:
+            await asyncio.sleep(self.mock_delay)
         self.call_count += 1
         
         return {
@@ -210,14 +422,22 @@ class MockAIModel(AIModelInterface):
 class IntelligentReplyGenerator:
     """智能回复生成器核心类"""
     
-    def __init__(self, work_path: str = "Comments_Dynamic", preferred_model: str = None):
+    def __init__(self, work_path: str = "Comments_Dynamic", preferred_model: str = None,
+                 max_concurrent: int = 5, max_prompt_tokens: int = 6000):
         # 使用新的AI模型管理器
         self.ai_manager = AIModelManager()
         self.preferred_model = preferred_model
+        # 同时进行的模型调用数上限，避免并行生成时触发服务商的频率限制
+        self._call_semaphore = asyncio.Semaphore(max_concurrent)
+        # 提示词中可变内容的token上限：用户评论、分析、方案各占三分之一，超出时截断
+        self.max_prompt_tokens = max_prompt_tokens
+        self.truncation_count = 0
         
         self.work_path = Path(work_path)
         self.reply_history_path = self.work_path / "intelligent_replies"
         self.reply_history_path.mkdir(parents=True, exist_ok=True)
+        self.llm_cache_path = self.reply_history_path / "llm_cache"
+        self.llm_cache_path.mkdir(parents=True, exist_ok=True)
         
         # 家居改造专业配置
         self.renovation_styles = [
@@ -228,9 +448,91 @@ class IntelligentReplyGenerator:
         self.daily_budget = 50.0  # 每日预算
         self.current_daily_cost = 0.0
         self.last_cost_reset = datetime.now().date()
+        # 上次检查日期的单调时钟时间，一分钟内不重复检查
+        self._last_date_check = time.monotonic()
+        
+    async def _call(self, request: TaskRequest) -> TaskResult:
+        """调用AI模型处理任务，受并发数上限约束；分析和文本任务优先使用磁盘缓存"""
+        cache_file = None
+        if request.task_type in CACHEABLE_TASK_TYPES:
+            cache_file = self.llm_cache_path / f"{await self._cache_key(request)}.json"
+            cached = await self._read_cached_result(cache_file, request)
+            if cached is not None:
+                return cached
+        
+        async with self._call_semaphore:
+            result = await self.ai_manager.process_task(request, self.preferred_model)
+        
+        if cache_file is not None and result.success:
+            await self._write_cached_result(cache_file, result)
+        return result
+    
+    def _fit_prompt_text(self, name: str, text: str) -> str:
+        """截断放入提示词的可变内容，避免拼接后超出模型上下文窗口导致整个请求失败"""
+        text, truncated = truncate_to_tokens(text, self.max_prompt_tokens // 3)
+        if truncated:
+            self.truncation_count += 1
+            print(f"⚠️ {name}过长，已截断至{self.max_prompt_tokens // 3}个token（累计截断{self.truncation_count}次）")
+        return text
+    
+    async def _cache_key(self, request: TaskRequest) -> str:
+        """按任务类型、提示词、图片（路径+大小+修改时间）、参数和模型计算缓存键"""
+        hasher = hashlib.sha256()
+        hasher.update(request.task_type.value.encode())
+        hasher.update(b"\0" + request.prompt.encode())
+        for image_path in sorted(request.image_paths):
+            try:
+                stat = await aiofiles.os.stat(image_path)
+                image_id = f"{image_path}|{stat.st_size}|{stat.st_mtime_ns}"
+            except OSError:
+                image_id = image_path
+            hasher.update(b"\0" + image_id.encode())
+        parameters = {key: request.parameters[key] for key in sorted(request.parameters)}
+        hasher.update(b"\0" + dump_json_bytes(parameters))
+        hasher.update(b"\0" + str(self.preferred_model).encode())
+        return hasher.hexdigest()
+    
+    async def _read_cached_result(self, cache_file: Path, request: TaskRequest) -> Optional[TaskResult]:
+        """读取未过期的缓存结果，命中时不产生成本"""
+        try:
+            stat = await aiofiles.os.stat(cache_file)
+            if time.time() - stat.st_mtime > LLM_CACHE_TTL:
+                return None
+            async with aiofiles.open(cache_file, 'rb') as f:
+                cached = load_json_bytes(await f.read())
+        except (OSError, ValueError):
+            return None
         
+        return TaskResult(
+            task_id=request.task_id,
+            success=True,
+            result=cached["result"],
+            model_used=cached.get("model_used"),
+            cost_estimate=0.0
+        )
+    
+    async def _write_cached_result(self, cache_file: Path, result: TaskResult):
+        """先写临时文件再重命名，避免并发读取到写了一半的缓存"""
+        tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            data = dump_json_bytes({"model_used": result.model_used, "result": result.result})
+            async with aiofiles.open(tmp_file, 'wb') as f:
+                await f.write(data)
+            await aiofiles.os.replace(tmp_file, cache_file)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"写入模型输出缓存失败 {cache_file.name}: {e}")
+            try:
+                await aiofiles.os.remove(tmp_file)
+            except OSError:
+                pass
+    
     def reset_daily_cost_if_needed(self):
         """如果是新的一天，重置成本计算"""
+        now = time.monotonic()
+        if now - self._last_date_check < 60:
+            return
+        self._last_date_check = now
+        
         today = datetime.now().date()
         if today > self.last_cost_reset:
             self.current_daily_cost = 0.0
@@ -246,43 +548,20 @@ class IntelligentReplyGenerator:
         self.reset_daily_cost_if_needed()
         self.current_daily_cost += cost
     
-    async def analyze_comment_for_renovation(self, comment_data: Dict) -> Dict:
+    def analyze_comment_for_renovation(self, comment_data: Dict) -> Dict:
         """分析评论是否适合家居改造处理"""
-        content = comment_data.get('content', '').lower()
-        images = comment_data.get('downloaded_images', [])
-        
-        # 家居改造关键词
-        renovation_keywords = [
-            '改造', '装修', '设计', '房间', '客厅', '卧室', '厨房', '卫生间',
-            '收纳', '空间', '风格', '家具', '布局', '色彩', '搭配',
-            '出租屋', '小户型', '预算', 'diy'
-        ]
-        
-        # 计算匹配分数
-        keyword_matches = sum(1 for keyword in renovation_keywords if keyword in content)
-        has_room_images = len(images) > 0
-        
-        renovation_score = keyword_matches * 10
-        if has_room_images:
-            renovation_score += 30
-        
-        # 分类评论类型
-        if renovation_score >= 40:
-            comment_type = "high_priority_renovation"
-        elif renovation_score >= 20:
-            comment_type = "potential_renovation"
-        elif has_room_images:
-            comment_type = "image_consultation"
-        else:
-            comment_type = "general_inquiry"
+        image_count = len(comment_data.get('downloaded_images') or [])
+        comment_type, renovation_score, keyword_matches, priority = score_renovation_comment(
+            comment_data.get('content', ''), image_count
+        )
         
         return {
             "comment_type": comment_type,
             "renovation_score": renovation_score,
             "keyword_matches": keyword_matches,
-            "has_images": has_room_images,
-            "image_count": len(images),
-            "processing_priority": "high" if renovation_score >= 40 else "medium" if renovation_score >= 20 else "low"
+            "has_images": image_count > 0,
+            "image_count": image_count,
+            "processing_priority": priority
         }
     
     async def process_renovation_request(self, comment_data: Dict, 
@@ -309,259 +588,390 @@ class IntelligentReplyGenerator:
             "total_cost": 0.0,
             "success": True
         }
+        await self._emit(project_id, "start", {
+            "timestamp": processing_result["timestamp"],
+            "comment_data": comment_data
+        })
         
         try:
-            # 阶段1：分析评论和图片
-            print(f"🔍 正在分析评论和房屋图片...")
-            
             # 获取第一张图片作为主要分析对象
             main_image = None
             if comment_data.get('downloaded_images'):
                 main_image = comment_data['downloaded_images'][0]
+            if main_image and not Path(main_image).exists():
+                main_image = None
+            styles = (styles_to_generate or self.renovation_styles) if generate_images else []
             
-            if main_image and Path(main_image).exists():
-                # 使用AI模型管理器进行图片分析
-                analysis_request = TaskRequest(
-                    task_id=f"{project_id}_analysis",
-                    task_type=TaskType.IMAGE_ANALYSIS,
-                    prompt=f"""
-                    作为专业室内设计师，请对用户提供的房屋图片进行全面分析。
-                    
-                    用户需求：{comment_data.get('content', '')}
-                    
-                    请按以下格式进行详细分析：
-                    ## 1. 空间基本信息
-                    ## 2. 现状问题诊断  
-                    ## 3. 改造潜力评估
-                    ## 4. 用户需求匹配度
-                    """,
-                    image_paths=[main_image]
-                )
-                analysis_result_obj = await self.ai_manager.process_task(analysis_request, self.preferred_model)
-                
-                if analysis_result_obj.success:
-                    analysis_result = {
-                        "success": True,
-                        "analysis": analysis_result_obj.result.get("analysis", str(analysis_result_obj.result)),
-                        "cost_estimate": analysis_result_obj.cost_estimate
-                    }
-                else:
-                    analysis_result = {
-                        "success": False,
-                        "error": analysis_result_obj.error
-                    }
+            # 阶段1：模型能按要求返回JSON时，一次调用同时完成分析、方案和回复，评论和图片上下文只发送一次；
+            # 只返回纯文本的模型直接分阶段生成，避免先做两次注定失败的结构化调用
+            use_structured = self._structured_output_available()
+            structured, structured_cost = None, 0.0
+            if use_structured:
+                print("🔍 正在分析评论并生成改造方案和回复...")
+                structured, structured_cost = await self._run_structured_stage(project_id, comment_data, main_image, styles)
+            
+            if structured is not None:
+                analysis_result, plans_result, reply_result = structured
             else:
-                # 仅基于文字内容分析
-                text_analysis_request = TaskRequest(
-                    task_id=f"{project_id}_text_analysis",
-                    task_type=TaskType.TEXT_GENERATION,
-                    prompt=f"""
-                    基于用户的改造需求描述，提供专业的家居改造分析：
-                    
-                    用户需求：{comment_data.get('content', '')}
-                    
-                    请分析房屋类型、改造重点、预算建议等方面。
-                    """
-                )
-                analysis_result_obj = await self.ai_manager.process_task(text_analysis_request, self.preferred_model)
+                if use_structured:
+                    # 模型未按约定返回JSON时，退回到分阶段生成
+                    print("🔁 结构化输出解析失败，改为分阶段生成...")
+                processing_result["total_cost"] += structured_cost
+                reply_result = None
+                analysis_result = await self._run_analysis_stage(project_id, comment_data, main_image)
+                if not analysis_result["success"]:
+                    await self._emit(project_id, "finish", {"success": False, "error": "房屋分析失败"})
+                    return {"success": False, "error": "房屋分析失败", "details": analysis_result}
                 
-                if analysis_result_obj.success:
-                    analysis_result = {
-                        "success": True,
-                        "analysis": analysis_result_obj.result.get("generated_text", str(analysis_result_obj.result)),
-                        "cost_estimate": analysis_result_obj.cost_estimate
-                    }
-                else:
-                    analysis_result = {
-                        "success": False,
-                        "error": analysis_result_obj.error
-                    }
+                print("🏗️ 正在生成改造方案...")
+                plans_result = await self._run_planning_stage(project_id, comment_data, analysis_result)
+                if not plans_result["success"]:
+                    await self._emit(project_id, "finish", {"success": False, "error": "改造方案生成失败"})
+                    return {"success": False, "error": "改造方案生成失败", "details": plans_result}
             
-            if not analysis_result["success"]:
-                return {"success": False, "error": "房屋分析失败", "details": analysis_result}
+            await self._emit(project_id, "analysis", analysis_result)
+            await self._emit(project_id, "renovation_planning", plans_result)
             
             processing_result["processing_stages"]["analysis"] = analysis_result
             processing_result["total_cost"] += analysis_result.get("cost_estimate", 0)
-            
-            # 阶段2：生成改造方案
-            print(f"🏗️ 正在生成改造方案...")
-            plans_request = TaskRequest(
-                task_id=f"{project_id}_plans",
-                task_type=TaskType.TEXT_GENERATION,
-                prompt=f"""
-                基于以下房屋分析结果，请设计4个不同风格的改造方案：
-
-                【房屋分析结果】
-                {analysis_result["analysis"]}
-
-                【用户具体需求】
-                {comment_data.get('content', '')}
-
-                请为每个风格设计完整的改造方案，包括：现代简约、北欧自然、中式现代、工业复古风格。
-                每个方案要包含设计理念、色彩搭配、家具选择、预算估算等详细信息。
-                """
-            )
-            plans_result_obj = await self.ai_manager.process_task(plans_request, self.preferred_model)
-            
-            if plans_result_obj.success:
-                plans_result = {
-                    "success": True,
-                    "renovation_plans": plans_result_obj.result.get("generated_text", str(plans_result_obj.result)),
-                    "cost_estimate": plans_result_obj.cost_estimate
-                }
-            else:
-                plans_result = {
-                    "success": False,
-                    "error": plans_result_obj.error
-                }
-            
-            if not plans_result["success"]:
-                return {"success": False, "error": "改造方案生成失败", "details": plans_result}
-            
             processing_result["processing_stages"]["renovation_planning"] = plans_result
             processing_result["total_cost"] += plans_result.get("cost_estimate", 0)
             
-            # 阶段3：生成效果图（可选）
+            # 阶段2：生成效果图（可选）；已完成风格的结果随时写入处理结果，出错时也能保存下来
             generated_images = []
-            if generate_images:
+            processing_result["processing_stages"]["image_generation"] = generated_images
+            if styles:
                 print(f"🎨 正在生成改造效果图...")
-                styles = styles_to_generate or self.renovation_styles
                 
-                for style in styles:
-                    print(f"   正在生成{style}风格效果图...")
-                    
-                    # 生成效果图
-                    image_request = TaskRequest(
-                        task_id=f"{project_id}_{style}_image",
-                        task_type=TaskType.IMAGE_GENERATION,
-                        prompt=f"""
-                        请根据以下改造方案生成专业的室内设计效果图：
-                        
-                        风格：{style}
-                        改造方案：{plans_result["renovation_plans"]}
-                        原房间描述：{analysis_result["analysis"]}
-                        
-                        要求：专业室内设计渲染图，高质量，体现{style}风格特点。
-                        """,
-                        parameters={"style": style}
-                    )
-                    image_result_obj = await self.ai_manager.process_task(image_request, self.preferred_model)
-                    
-                    if image_result_obj.success:
-                        image_result = {
-                            "success": True,
-                            "image_url": image_result_obj.result.get("image_url", ""),
-                            "local_path": image_result_obj.result.get("local_path", ""),
-                            "style": style,
-                            "cost_estimate": image_result_obj.cost_estimate
-                        }
-                        processing_result["total_cost"] += image_result_obj.cost_estimate
-                    else:
-                        image_result = {
-                            "success": False,
-                            "error": image_result_obj.error,
-                            "style": style
-                        }
-                    
-                    generated_images.append(image_result)
-                    
-                    # 生成对比图
-                    if image_result["success"] and main_image and Path(main_image).exists():
-                        comparison_request = TaskRequest(
-                            task_id=f"{project_id}_{style}_comparison",
-                            task_type=TaskType.COMPARISON_CREATION,
-                            prompt=f"""
-                            请创建{style}风格的改造前后对比图。
-                            突出关键改造变化点，专业布局。
-                            """,
-                            image_paths=[main_image, image_result.get("local_path", "")]
-                        )
-                        comparison_result_obj = await self.ai_manager.process_task(comparison_request, self.preferred_model)
-                        
-                        if comparison_result_obj.success:
-                            comparison_result = {
-                                "success": True,
-                                "comparison_image_url": comparison_result_obj.result.get("comparison_url", ""),
-                                "local_path": comparison_result_obj.result.get("local_path", ""),
-                                "style": style,
-                                "cost_estimate": comparison_result_obj.cost_estimate
-                            }
-                            processing_result["total_cost"] += comparison_result_obj.cost_estimate
-                        else:
-                            comparison_result = {
-                                "success": False,
-                                "error": comparison_result_obj.error,
-                                "style": style
-                            }
-                        
-                        generated_images.append(comparison_result)
-            
-            processing_result["processing_stages"]["image_generation"] = generated_images
-            
-            # 阶段4：生成智能回复
-            print(f"💬 正在生成智能回复...")
-            reply_request = TaskRequest(
-                task_id=f"{project_id}_reply",
-                task_type=TaskType.TEXT_GENERATION,
-                prompt=f"""
-                作为小红书家居博主，请为用户的改造需求生成专业回复：
-
-                【用户原评论】
-                {comment_data.get('content', '')}
-
-                【专业分析结果】
-                {analysis_result["analysis"]}
-
-                【改造方案】
-                {plans_result["renovation_plans"]}
-
-                【生成的效果图】
-                已为您生成了以下风格的改造效果图：{', '.join([img.get('style', '') for img in generated_images if img.get('success')])}
-
-                请生成3个不同版本的回复：
-                1. 详细专业版（200-300字）
-                2. 简洁实用版（100-150字）  
-                3. 互动引导版（150-200字）
-
-                要求语言亲和友好，体现专业性，适当引导用户互动。
-                """
-            )
-            reply_result_obj = await self.ai_manager.process_task(reply_request, self.preferred_model)
+                async def generate_and_log(style: str) -> List[Dict]:
+                    results = await self._generate_style_images(project_id, style, analysis_result,
+                                                                plans_result, main_image)
+                    # 每个风格完成时立即计入成本，其他风格出错被取消时已完成的部分仍会记账
+                    for result in results:
+                        if result["success"]:
+                            processing_result["total_cost"] += result.get("cost_estimate", 0)
+                    generated_images.extend(results)
+                    await self._emit(project_id, "image_generation", {"style": style, "results": results})
+                    return results
+                
+                # 各风格互不依赖，同时生成；每个风格内效果图完成后接着生成对比图。
+                # 任一风格的模型调用抛出异常时TaskGroup会取消其余仍在进行的调用，不再继续计费
+                async with asyncio.TaskGroup() as tg:
+                    style_tasks = [tg.create_task(generate_and_log(style)) for style in styles]
+                # 全部完成后按风格顺序排列
+                generated_images[:] = [result for task in style_tasks for result in task.result()]
             
-            if reply_result_obj.success:
-                reply_result = {
-                    "success": True,
-                    "replies": reply_result_obj.result.get("generated_text", str(reply_result_obj.result)),
-                    "cost_estimate": reply_result_obj.cost_estimate
-                }
-                processing_result["total_cost"] += reply_result_obj.cost_estimate
-            else:
-                reply_result = {
-                    "success": False,
-                    "error": reply_result_obj.error
-                }
+            # 阶段3：生成智能回复（结构化输出中已包含时跳过）
+            if reply_result is None:
+                print(f"💬 正在生成智能回复...")
+                reply_result = await self._run_reply_stage(project_id, comment_data, analysis_result,
+                                                           plans_result, generated_images)
             
             processing_result["processing_stages"]["reply_generation"] = reply_result
+            await self._emit(project_id, "reply_generation", reply_result)
             if reply_result["success"]:
                 processing_result["total_cost"] += reply_result.get("cost_estimate", 0)
             
-            # 记录成本
-            self.add_cost(processing_result["total_cost"])
-            
-            # 保存处理结果
+            # 保存处理结果：汇总文件写入后，过程日志不再需要
+            await self._emit(project_id, "finish", {"total_cost": processing_result["total_cost"], "success": True})
             await self.save_processing_result(processing_result)
+            self._events_path(project_id).unlink(missing_ok=True)
             
             return processing_result
             
         except Exception as e:
+            if isinstance(e, ExceptionGroup):
+                # TaskGroup把子任务的异常包装成异常组，记录第一个实际错误
+                e = e.exceptions[0]
             processing_result["success"] = False
             processing_result["error"] = f"处理异常: {str(e)}"
+            await self._emit(project_id, "finish", {"success": False, "error": processing_result["error"]})
+            # 已完成并计费的阶段照样保存，失败的请求也会出现在处理历史中
+            try:
+                await self.save_processing_result(processing_result)
+                self._events_path(project_id).unlink(missing_ok=True)
+            except Exception as save_error:
+                print(f"⚠️ 保存部分处理结果失败: {save_error}")
             return processing_result
+        finally:
+            # 各阶段成本先在本次请求内累计，无论成功、失败还是中途返回，都只记一次账
+            self.add_cost(processing_result["total_cost"])
+    
+    async def batch_process(self, comments: List[Dict], max_workers: int = 5,
+                            generate_images: bool = True,
+                            styles_to_generate: List[str] = None) -> AsyncIterator[Tuple[Dict, Dict]]:
+        """并发处理多条评论，按完成顺序逐条产出(评论数据, 处理结果)
+        
+        max_workers限制同时处理的评论数；单次模型调用仍受实例的并发上限约束
+        """
+        semaphore = asyncio.Semaphore(max_workers)
+        
+        async def process_one(comment_data: Dict) -> Tuple[Dict, Dict]:
+            async with semaphore:
+                result = await self.process_renovation_request(comment_data, generate_images, styles_to_generate)
+            return comment_data, result
+        
+        for next_done in asyncio.as_completed([process_one(comment) for comment in comments]):
+            yield await next_done
+    
+    def _structured_output_available(self) -> bool:
+        """处理文本生成的模型能按要求返回JSON时才使用结构化输出（与AIModelManager的选模型规则一致）"""
+        model = self.ai_manager.models.get(self.preferred_model)
+        if model is None or not model.can_handle_task(TaskType.TEXT_GENERATION):
+            model = self.ai_manager.select_best_model(TaskType.TEXT_GENERATION)
+        return model is not None and model.can_handle_task(TaskType.STRUCTURED_MULTI)
+    
+    async def _run_structured_stage(self, project_id: str, comment_data: Dict,
+                                    main_image: Optional[str], styles: List[str]) -> Tuple[Optional[Tuple[Dict, Dict, Dict]], float]:
+        """一次调用生成分析、改造方案和回复
+        
+        Returns:
+            (三个阶段的结果, 本次调用成本)；调用失败或输出无法解析时结果为None
+        """
+        styles_note = f"将为用户生成以下风格的改造效果图：{', '.join(styles)}" if styles else "本次不生成效果图"
+        structured_request = TaskRequest(
+            task_id=f"{project_id}_structured",
+            task_type=TaskType.STRUCTURED_MULTI,
+            prompt=STRUCTURED_PROMPT_TEMPLATE.format_map({
+                "styles_note": styles_note,
+                "user_content": self._fit_prompt_text("用户评论", comment_data.get('content', ''))
+            }),
+            image_paths=[main_image] if main_image else []
+        )
+        result_obj, structured = await self._call_validated(
+            structured_request, self._parse_structured_output, STRICT_JSON_HINT
+        )
+        if structured is None:
+            return None, result_obj.cost_estimate
+        
+        # 整次调用的成本记在分析阶段，其余阶段不重复计费
+        analysis_result = {
+            "success": True,
+            "analysis": structured.analysis,
+            "cost_estimate": result_obj.cost_estimate,
+            "structured": True
+        }
+        plans_result = {"success": True, "renovation_plans": structured.plans, "cost_estimate": 0.0}
+        reply_result = {"success": True, "replies": structured.replies, "cost_estimate": 0.0}
+        return (analysis_result, plans_result, reply_result), result_obj.cost_estimate
+    
+    async def _call_validated(self, request: TaskRequest, parse, strict_hint: str) -> Tuple[TaskResult, Any]:
+        """调用模型并校验输出；格式不符合要求时追加严格格式提示重试一次
+        
+        Returns:
+            (任务结果, 校验后的输出)；任务结果的成本包含重试，两次都不合格时输出为None
+        """
+        result_obj = await self._call(request)
+        if not result_obj.success:
+            return result_obj, None
+        parsed = parse(result_obj.result)
+        if parsed is not None:
+            return result_obj, parsed
+        
+        # 不合格的输出不保留在缓存中，只重做这一步
+        await self._discard_cached_result(request)
+        print(f"🔁 {request.task_id} 输出格式无效，重试一次...")
+        retry_request = dataclasses.replace(
+            request, task_id=f"{request.task_id}_retry", prompt=request.prompt + strict_hint
+        )
+        retry_obj = await self._call(retry_request)
+        total_cost = result_obj.cost_estimate + retry_obj.cost_estimate
+        parsed = parse(retry_obj.result) if retry_obj.success else None
+        if retry_obj.success and parsed is None:
+            await self._discard_cached_result(retry_request)
+        return dataclasses.replace(retry_obj, cost_estimate=total_cost), parsed
+    
+    async def _discard_cached_result(self, request: TaskRequest):
+        """删除请求对应的模型输出缓存"""
+        if request.task_type not in CACHEABLE_TASK_TYPES:
+            return
+        try:
+            await aiofiles.os.remove(self.llm_cache_path / f"{await self._cache_key(request)}.json")
+        except FileNotFoundError:
+            pass
+    
+    def _parse_structured_output(self, result: Any) -> Optional[StructuredOutput]:
+        """解析结构化输出，兼容模型在JSON前后附带说明文字或代码块标记的情况"""
+        text = result.get("generated_text", "") if isinstance(result, dict) else str(result)
+        match = JSON_OBJECT_RE.search(text)
+        if not match:
+            return None
+        try:
+            return StructuredOutput.model_validate_json(match.group(0))
+        except ValidationError:
+            return None
+    
+    @staticmethod
+    def _output_parser(schema: type):
+        """生成按指定模型校验任务输出的解析函数"""
+        def parse(result: Any) -> Optional[BaseModel]:
+            try:
+                return schema.model_validate(result)
+            except ValidationError:
+                return None
+        return parse
+    
+    async def _run_analysis_stage(self, project_id: str, comment_data: Dict, main_image: Optional[str]) -> Dict:
+        """分阶段生成：分析评论和图片"""
+        if main_image:
+            # 使用AI模型管理器进行图片分析
+            analysis_request = TaskRequest(
+                task_id=f"{project_id}_analysis",
+                task_type=TaskType.IMAGE_ANALYSIS,
+                prompt=IMAGE_ANALYSIS_PROMPT_TEMPLATE.format_map({
+                    "user_content": self._fit_prompt_text("用户评论", comment_data.get('content', ''))
+                }),
+                image_paths=[main_image]
+            )
+            output_schema = AnalysisOutput
+        else:
+            # 仅基于文字内容分析
+            analysis_request = TaskRequest(
+                task_id=f"{project_id}_text_analysis",
+                task_type=TaskType.TEXT_GENERATION,
+                prompt=TEXT_ANALYSIS_PROMPT_TEMPLATE.format_map({
+                    "user_content": self._fit_prompt_text("用户评论", comment_data.get('content', ''))
+                })
+            )
+            output_schema = TextOutput
+        
+        analysis_result_obj, output = await self._call_validated(
+            analysis_request, self._output_parser(output_schema), STRICT_TEXT_HINT
+        )
+        if not analysis_result_obj.success:
+            return {"success": False, "error": analysis_result_obj.error}
+        if output is None:
+            return {"success": False, "error": "模型输出格式无效"}
+        return {
+            "success": True,
+            "analysis": output.analysis if output_schema is AnalysisOutput else output.generated_text,
+            "cost_estimate": analysis_result_obj.cost_estimate
+        }
+    
+    async def _run_planning_stage(self, project_id: str, comment_data: Dict, analysis_result: Dict) -> Dict:
+        """分阶段生成：生成改造方案"""
+        plans_request = TaskRequest(
+            task_id=f"{project_id}_plans",
+            task_type=TaskType.TEXT_GENERATION,
+            prompt=PLANS_PROMPT_TEMPLATE.format_map({
+                "analysis": self._fit_prompt_text("房屋分析", analysis_result["analysis"]),
+                "user_content": self._fit_prompt_text("用户评论", comment_data.get('content', ''))
+            })
+        )
+        plans_result_obj, output = await self._call_validated(
+            plans_request, self._output_parser(TextOutput), STRICT_TEXT_HINT
+        )
+        if not plans_result_obj.success:
+            return {"success": False, "error": plans_result_obj.error}
+        if output is None:
+            return {"success": False, "error": "模型输出格式无效"}
+        return {
+            "success": True,
+            "renovation_plans": output.generated_text,
+            "cost_estimate": plans_result_obj.cost_estimate
+        }
+    
+    async def _run_reply_stage(self, project_id: str, comment_data: Dict, analysis_result: Dict,
+                               plans_result: Dict, generated_images: List[Dict]) -> Dict:
+        """分阶段生成：生成智能回复"""
+        reply_request = TaskRequest(
+            task_id=f"{project_id}_reply",
+            task_type=TaskType.TEXT_GENERATION,
+            prompt=REPLY_PROMPT_TEMPLATE.format_map({
+                "user_content": self._fit_prompt_text("用户评论", comment_data.get('content', '')),
+                "analysis": self._fit_prompt_text("房屋分析", analysis_result["analysis"]),
+                "plans": self._fit_prompt_text("改造方案", plans_result["renovation_plans"]),
+                "styles": ', '.join([img.get('style', '') for img in generated_images if img.get('success')])
+            })
+        )
+        reply_result_obj, output = await self._call_validated(
+            reply_request, self._output_parser(TextOutput), STRICT_TEXT_HINT
+        )
+        if not reply_result_obj.success:
+            return {"success": False, "error": reply_result_obj.error}
+        if output is None:
+            return {"success": False, "error": "模型输出格式无效"}
+        return {
+            "success": True,
+            "replies": output.generated_text,
+            "cost_estimate": reply_result_obj.cost_estimate
+        }
+    
+    def _build_image_request(self, project_id: str, style: str,
+                             analysis_result: Dict, plans_result: Dict) -> TaskRequest:
+        """构建单个风格的效果图生成请求"""
+        return TaskRequest(
+            task_id=f"{project_id}_{style}_image",
+            task_type=TaskType.IMAGE_GENERATION,
+            prompt=IMAGE_PROMPT_TEMPLATE.format_map({
+                "analysis": self._fit_prompt_text("房屋分析", analysis_result["analysis"]),
+                "plans": self._fit_prompt_text("改造方案", plans_result["renovation_plans"]),
+                "style": style
+            }),
+            parameters={"style": style}
+        )
+    
+    def _build_comparison_request(self, project_id: str, style: str,
+                                  main_image: str, generated_image: str) -> TaskRequest:
+        """构建单个风格的改造前后对比图请求"""
+        return TaskRequest(
+            task_id=f"{project_id}_{style}_comparison",
+            task_type=TaskType.COMPARISON_CREATION,
+            prompt=COMPARISON_PROMPT_TEMPLATE.format_map({"style": style}),
+            image_paths=[main_image, generated_image]
+        )
+    
+    async def _generate_style_images(self, project_id: str, style: str, analysis_result: Dict,
+                                     plans_result: Dict, main_image: Optional[str]) -> List[Dict]:
+        """生成单个风格的效果图，有原图时再生成对比图
+        
+        模型返回失败时记为该风格失败；调用抛出的异常直接向上传播，由TaskGroup取消其余风格
+        """
+        print(f"   正在生成{style}风格效果图...")
+        
+        image_request = self._build_image_request(project_id, style, analysis_result, plans_result)
+        image_result_obj = await self._call(image_request)
+        
+        if not image_result_obj.success:
+            return [{"success": False, "error": image_result_obj.error, "style": style}]
+        
+        image_result = {
+            "success": True,
+            "image_url": image_result_obj.result.get("image_url", ""),
+            "local_path": image_result_obj.result.get("local_path", ""),
+            "style": style,
+            "cost_estimate": image_result_obj.cost_estimate
+        }
+        if not main_image:
+            return [image_result]
+        
+        # 生成对比图
+        comparison_request = self._build_comparison_request(
+            project_id, style, main_image, image_result.get("local_path", "")
+        )
+        comparison_result_obj = await self._call(comparison_request)
+        
+        if comparison_result_obj.success:
+            comparison_result = {
+                "success": True,
+                "comparison_image_url": comparison_result_obj.result.get("comparison_url", ""),
+                "local_path": comparison_result_obj.result.get("local_path", ""),
+                "style": style,
+                "cost_estimate": comparison_result_obj.cost_estimate
+            }
+        else:
+            comparison_result = {
+                "success": False,
+                "error": comparison_result_obj.error,
+                "style": style
+            }
+        return [image_result, comparison_result]
     
     def generate_project_id(self, comment_data: Dict) -> str:
         """生成项目ID"""
         unique_str = f"{comment_data.get('nickname', 'unknown')}_{comment_data.get('time', '')}_{datetime.now().isoformat()}"
-        return hashlib.md5(unique_str.encode()).hexdigest()[:12]
+        # 6字节摘要正好是12位十六进制，与原有项目ID长度一致
+        return hashlib.blake2b(unique_str.encode(), digest_size=6).hexdigest()
     
     async def save_processing_result(self, result: Dict):
         """保存处理结果"""
@@ -571,44 +981,109 @@ class IntelligentReplyGenerator:
         # 确保目录存在
         save_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(save_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        async with aiofiles.open(save_path, 'wb') as f:
+            await f.write(dump_json_bytes(result, indent=True))
     
     async def load_processing_result(self, project_id: str) -> Optional[Dict]:
-        """加载处理结果"""
+        """加载处理结果；没有汇总文件时（处理中断），由过程日志还原已完成的阶段"""
         save_path = self.reply_history_path / f"{project_id}_result.json"
         
         if save_path.exists():
-            with open(save_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            async with aiofiles.open(save_path, 'rb') as f:
+                return load_json_bytes(await f.read())
+        
+        events_path = self._events_path(project_id)
+        if events_path.exists():
+            events = []
+            async with aiofiles.open(events_path, 'rb') as f:
+                async for line in f:
+                    if line.strip():
+                        events.append(load_json_bytes(line))
+            return self._fold_events(project_id, events)
         return None
     
-    def get_processing_history(self, limit: int = 50) -> List[Dict]:
+    def _events_path(self, project_id: str) -> Path:
+        """处理过程日志路径，每完成一个阶段追加一行"""
+        return self.reply_history_path / f"{project_id}_events.jsonl"
+    
+    async def _emit(self, project_id: str, stage: str, payload: Dict):
+        """追加一条阶段完成记录，进程中断时已完成的阶段不会丢失"""
+        line = dump_json_bytes({"stage": stage, "ts": time.time(), "payload": payload}) + b"\n"
+        try:
+            async with aiofiles.open(self._events_path(project_id), 'ab') as f:
+                await f.write(line)
+        except OSError as e:
+            print(f"写入处理日志失败 {project_id}: {e}")
+    
+    def _fold_events(self, project_id: str, events: List[Dict]) -> Dict:
+        """把过程日志还原成与汇总文件相同结构的处理结果"""
+        result = {
+            "project_id": project_id,
+            "timestamp": None,
+            "comment_data": {},
+            "processing_stages": {},
+            "total_cost": 0.0,
+            "success": False,
+            "error": "处理未完成"
+        }
+        stages = result["processing_stages"]
+        finished = False
+        
+        for event in events:
+            stage, payload = event["stage"], event["payload"]
+            if stage == "start":
+                result.update(payload)
+            elif stage == "finish":
+                finished = True
+                result.pop("error", None)
+                result.update(payload)
+            elif stage == "image_generation":
+                stages.setdefault("image_generation", []).extend(payload["results"])
+            else:
+                stages[stage] = payload
+        
+        if not finished:
+            # 未结束的处理按已完成阶段累计成本
+            result["total_cost"] = sum(
+                stage_result.get("cost_estimate", 0)
+                for stage_result in [stages.get("analysis", {}), stages.get("renovation_planning", {}),
+                                     stages.get("reply_generation", {}), *stages.get("image_generation", [])]
+                if stage_result.get("success")
+            )
+        return result
+    
+    async def _read_history_entry(self, file_path: Path) -> Optional[Dict]:
+        """读取单个处理结果文件并生成历史摘要"""
+        try:
+            async with aiofiles.open(file_path, 'rb') as f:
+                result = load_json_bytes(await f.read())
+            return {
+                "project_id": result["project_id"],
+                "timestamp": result["timestamp"],
+                "user_nickname": result["comment_data"].get("nickname", "未知"),
+                "comment_preview": result["comment_data"].get("content", "")[:50] + "...",
+                "total_cost": result["total_cost"],
+                "success": result["success"]
+            }
+        except Exception as e:
+            print(f"读取历史记录失败 {file_path}: {e}")
+            return None
+    
+    async def get_processing_history(self, limit: int = 50) -> List[Dict]:
         """获取处理历史"""
-        history_files = sorted(
-            self.reply_history_path.glob("*_result.json"),
-            key=lambda x: x.stat().st_mtime,
-            reverse=True
-        )
+        # 一次目录扫描拿到文件名和修改时间，只取最新的limit个
+        with os.scandir(self.reply_history_path) as it:
+            history_files = heapq.nlargest(
+                limit,
+                ((entry.stat().st_mtime, entry.path) for entry in it if entry.name.endswith("_result.json")),
+                key=itemgetter(0)
+            )
         
-        history = []
-        for file_path in history_files[:limit]:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    result = json.load(f)
-                    history.append({
-                        "project_id": result["project_id"],
-                        "timestamp": result["timestamp"],
-                        "user_nickname": result["comment_data"].get("nickname", "未知"),
-                        "comment_preview": result["comment_data"].get("content", "")[:50] + "...",
-                        "total_cost": result["total_cost"],
-                        "success": result["success"]
-                    })
-            except Exception as e:
-                print(f"读取历史记录失败 {file_path}: {e}")
-                continue
-        
-        return history
+        # 各历史文件互不依赖，并发读取
+        entries = await asyncio.gather(
+            *(self._read_history_entry(Path(file_path)) for _, file_path in history_files)
+        )
+        return [entry for entry in entries if entry is not None]
     
     def get_daily_statistics(self) -> Dict:
         """获取每日统计"""
@@ -628,10 +1103,14 @@ def create_intelligent_reply_generator(preferred_model: str = "mock_gpt4o", **kw
     """创建智能回复生成器实例"""
     
     work_path = kwargs.get('work_path', 'Comments_Dynamic')
+    max_concurrent = kwargs.get('max_concurrent', 5)
+    max_prompt_tokens = kwargs.get('max_prompt_tokens', 6000)
     
     return IntelligentReplyGenerator(
         work_path=work_path, 
-        preferred_model=preferred_model
+        preferred_model=preferred_model,
+        max_concurrent=max_concurrent,
+        max_prompt_tokens=max_prompt_tokens
     )
 
 
@@ -655,7 +1134,7 @@ async def test_intelligent_reply_generator():
     print("="*50)
     
     # 分析评论类型
-    analysis = await generator.analyze_comment_for_renovation(test_comment)
+    analysis = generator.analyze_comment_for_renovation(test_comment)
     print(f"📊 评论分析结果: {analysis}")
     
     # 处理改造请求
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON编解码工具
+评论提取器、本地评论加载器和智能回复生成器共用
+
+可选依赖：orjson（缺失时回退到标准库json）
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，缺失时回退到标准库json
+    orjson = None
+
+# 是否可用orjson（需要区分写文件方式的调用方使用）
+HAS_ORJSON = orjson is not None
+
+
+def dump_json_bytes(data, indent: bool = False) -> bytes:
+    """序列化为UTF-8编码的JSON，优先使用orjson"""
+    if orjson is not None:
+        # 页面状态中可能出现数字键，OPT_NON_STR_KEYS与json模块的行为保持一致
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(data, option=option)
+        except orjson.JSONEncodeError:
+            # 超过64位的整数等orjson不支持的值，交给json模块处理
+            pass
+    return json.dumps(data, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+
+def load_json_bytes(data):
+    """解析JSON（bytes或str），优先使用orjson"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -5,14 +5,116 @@
 从Comments_Dynamic目录中加载历史评论数据
 """
 
-import json
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from dataclasses import dataclass, field
+from operator import attrgetter, itemgetter
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import re
 
+from json_utils import dump_json_bytes, load_json_bytes
+
+
+# 扫描作品时跳过的特殊目录
+SKIP_WORK_DIRS = frozenset(('browser_profile', 'debug', 'test_work', 'all_comment_images'))
+
+# 作品扫描结果的持久化缓存文件（位于Comments_Dynamic目录下）
+SCAN_CACHE_FILE = ".scan_cache.json"
+
+# 从原始数据.json的字节中直接取出create_time，扫描时无需解析整个文件；
+# 评论正文中的引号会被转义，不会误匹配
+CREATE_TIME_RE = re.compile(rb'"create_time"\s*:\s*(\d+)\s*[,}]')
+
+# 视为评论图片的文件扩展名
+IMAGE_EXTENSIONS = frozenset(('.jpg', '.jpeg', '.png', '.gif'))
+
+# 作品摘要的固定部分，统计字段名与get_work_statistics的返回值一致
+SUMMARY_HEADER_TEMPLATE = """
+# {title} - 评论摘要
+
+## 基本信息
+- 作品ID: {work_id}
+- 提取时间: {extract_time}
+- 作品链接: {work_link}
+
+## 统计信息
+- 总评论数: {total_comments} 条
+- 有图评论: {comments_with_images} 条
+- 纯文本评论: {comments_without_images} 条
+- 总图片数: {total_images} 张
+- 已下载图片: {total_downloaded_images} 张
+
+## 最新评论预览
+"""
+
+# 并发扫描作品/读取评论的最大线程数（以文件IO为主，读文件时会释放GIL）
+SCAN_MAX_WORKERS = 32
+
+
+def is_image_name(name: str) -> bool:
+    """按扩展名判断文件名是否为图片"""
+    dot = name.rfind('.')
+    return dot >= 0 and name[dot:].lower() in IMAGE_EXTENSIONS
+
+
+def format_timestamp_ms(create_time) -> str:
+    """把毫秒时间戳格式化为可读时间，用time.strftime避免逐条创建datetime对象"""
+    try:
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(create_time / 1000))
+    except (OverflowError, OSError, TypeError, ValueError):
+        return str(create_time)
+
+
+def file_mtime_ns(path) -> int:
+    """文件的修改时间（纳秒），文件不存在时返回0"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def read_json_file(path):
+    """以二进制读取并解析JSON文件，省去文本解码这一步"""
+    with open(path, 'rb') as f:
+        return load_json_bytes(f.read())
+
+
+@dataclass(slots=True)
+class CommentRecord:
+    """加载后的单条评论（使用__slots__，缓存大量评论时比字典更省内存）"""
+    nickname: str
+    time: str
+    content: str
+    images: List[str]
+    downloaded_images: List[str]
+    comment_dir: str
+    timestamp: str
+    create_time: int
+    # 小写化的内容和昵称，加载时算一次，供每次搜索复用
+    content_lower: str = field(init=False, repr=False, compare=False)
+    nickname_lower: str = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self.content_lower = self.content.lower()
+        self.nickname_lower = self.nickname.lower()
+    
+    def as_dict(self) -> Dict:
+        """转换为评论字典（与现有格式兼容）"""
+        return {
+            'nickname': self.nickname,
+            'time': self.time,
+            'content': self.content,
+            'images': list(self.images),
+            'downloaded_images': list(self.downloaded_images),
+            'comment_dir': self.comment_dir,
+            'timestamp': self.timestamp,
+            'create_time': self.create_time
+        }
+
 
 class LocalCommentLoader:
     """本地评论数据加载器"""
@@ -26,12 +128,38 @@ class LocalCommentLoader:
         self.base_path = Path(base_path)
         self._works_cache = None
         self._last_scan_time = None
+        # 两级缓存都以(目录mtime, 作品信息mtime, 提取报告mtime)判断是否过期：
+        # 作品信息在提取开始时写入、提取报告在所有评论保存后才写入，提取过程中缓存的不完整结果会在提取结束后失效；
+        # 覆盖已有用户目录里的文件不会改变作品目录的mtime，也要靠提取报告来发现
+        # 持久化扫描缓存：作品目录 -> {mtime: [目录mtime, 作品信息mtime, 提取报告mtime], work_data: 扫描结果}
+        self._scan_cache_file = self.base_path / SCAN_CACHE_FILE
+        self._persistent_cache = self._load_scan_cache()
+        # 评论缓存：作品目录 -> ((目录mtime, 作品信息mtime, 提取报告mtime), 评论记录列表)
+        self._comments_cache: Dict[str, Tuple[Tuple[int, int, int], List[CommentRecord]]] = {}
+    
+    def _load_scan_cache(self) -> Dict[str, Dict]:
+        """读取持久化扫描缓存，文件缺失或损坏时返回空缓存"""
+        try:
+            cache = read_json_file(self._scan_cache_file)
+            return cache if isinstance(cache, dict) else {}
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_scan_cache(self):
+        """先写临时文件再替换，避免留下写了一半的缓存"""
+        tmp_file = self._scan_cache_file.with_name(f"{SCAN_CACHE_FILE}.{os.getpid()}.tmp")
+        try:
+            tmp_file.write_bytes(dump_json_bytes(self._persistent_cache))
+            os.replace(tmp_file, self._scan_cache_file)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"写入扫描缓存失败: {e}")
+            tmp_file.unlink(missing_ok=True)
     
     def scan_available_works(self, force_refresh: bool = False) -> List[Dict]:
         """扫描可用的作品目录
         
         Args:
-            force_refresh: 是否强制刷新缓存
+            force_refresh: 是否强制刷新缓存（同时忽略持久化扫描缓存）
             
         Returns:
             作品信息列表
@@ -45,59 +173,65 @@ class LocalCommentLoader:
             return self._works_cache
         
         works = []
+        scan_cache = {}
+        cache_dirty = False
         
-        if not self.base_path.exists():
+        # 扫描所有子目录（目录不存在时直接返回空列表）
+        try:
+            with os.scandir(self.base_path) as it:
+                work_entries = [entry for entry in it if entry.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
             return works
         
-        # 扫描所有子目录
-        for work_dir in self.base_path.iterdir():
-            if not work_dir.is_dir():
-                continue
-            
+        # 本次扫描的所有作品共用一个扫描时间
+        scan_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        # 需要重新扫描的作品：(作品目录, mtime)
+        pending = []
+        for entry in work_entries:
             # 跳过特殊目录
-            skip_dirs = ['browser_profile', 'debug', 'test_work', 'all_comment_images']
-            if work_dir.name in skip_dirs:
+            if entry.name in SKIP_WORK_DIRS:
                 continue
             
             # 检查是否包含作品信息文件
-            work_info_file = work_dir / "作品信息.json"
-            if not work_info_file.exists():
+            work_info_file = os.path.join(entry.path, "作品信息.json")
+            try:
+                mtime = [entry.stat(follow_symlinks=False).st_mtime_ns,
+                         os.stat(work_info_file).st_mtime_ns,
+                         file_mtime_ns(os.path.join(entry.path, "提取报告.txt"))]
+            except OSError:
                 continue
             
-            try:
-                # 读取作品信息
-                with open(work_info_file, 'r', encoding='utf-8') as f:
-                    work_info = json.load(f)
-                
-                # 统计评论数量
-                comment_count = self._count_comments_in_work(work_dir)
-                
-                # 获取最新评论时间
-                latest_comment_time = self._get_latest_comment_time(work_dir)
-                
-                # 检查是否有图片
-                has_images = self._check_work_has_images(work_dir)
-                
-                work_data = {
-                    'work_title': work_info.get('作品标题', work_dir.name),
-                    'work_id': work_info.get('作品ID', ''),
-                    'work_link': work_info.get('作品链接', ''),
-                    'work_description': work_info.get('作品描述', ''),
-                    'work_dir': str(work_dir),
-                    'comment_count': comment_count,
-                    'latest_comment_time': latest_comment_time,
-                    'has_images': has_images,
-                    'scan_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                
+            # 目录、作品信息和提取报告都没有变化时直接复用上次的扫描结果
+            # （旧版本缓存没有latest_ts字段，需要重新扫描）
+            cached = self._persistent_cache.get(entry.path)
+            if (not force_refresh and cached and cached.get('mtime') == mtime and
+                    'latest_ts' in cached['work_data']):
+                work_data = dict(cached['work_data'], scan_time=scan_time)
                 works.append(work_data)
-                
-            except Exception as e:
-                print(f"读取作品信息失败 {work_dir.name}: {e}")
+                scan_cache[entry.path] = cached
                 continue
+            
+            pending.append((entry.path, mtime))
+        
+        # 各作品的扫描以阻塞IO为主，放到线程池中并发执行
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(SCAN_MAX_WORKERS, len(pending))) as pool:
+                results = pool.map(self._scan_work_dir, [path for path, _ in pending], repeat(scan_time))
+                for (path, mtime), work_data in zip(pending, results):
+                    if work_data is None:
+                        continue
+                    works.append(work_data)
+                    scan_cache[path] = {'mtime': mtime, 'work_data': work_data}
+                    cache_dirty = True
+        
+        # 顺带清理已删除作品的缓存条目
+        if cache_dirty or scan_cache.keys() != self._persistent_cache.keys():
+            self._persistent_cache = scan_cache
+            self._save_scan_cache()
         
         # 按最新评论时间排序
-        works.sort(key=lambda x: x['latest_comment_time'] or '', reverse=True)
+        works.sort(key=itemgetter('latest_ts'), reverse=True)
         
         # 更新缓存
         self._works_cache = works
@@ -105,6 +239,42 @@ class LocalCommentLoader:
         
         return works
     
+    def _scan_work_dir(self, work_dir_path: str, scan_time: str) -> Optional[Dict]:
+        """扫描单个作品目录，读取作品信息并统计评论
+        
+        Args:
+            work_dir_path: 作品目录路径
+            scan_time: 本次扫描时间
+            
+        Returns:
+            作品信息字典，读取失败时返回None
+        """
+        work_dir = Path(work_dir_path)
+        
+        try:
+            # 读取作品信息
+            work_info = read_json_file(work_dir / "作品信息.json")
+            
+            # 一次遍历统计评论数量、最新评论时间和是否有图片
+            comment_count, latest_ts, latest_comment_time, has_images = self._scan_work_once(work_dir)
+            
+            return {
+                'work_title': work_info.get('作品标题', work_dir.name),
+                'work_id': work_info.get('作品ID', ''),
+                'work_link': work_info.get('作品链接', ''),
+                'work_description': work_info.get('作品描述', ''),
+                'work_dir': str(work_dir),
+                'comment_count': comment_count,
+                'latest_comment_time': latest_comment_time,
+                'latest_ts': latest_ts,
+                'has_images': has_images,
+                'scan_time': scan_time
+            }
+            
+        except Exception as e:
+            print(f"读取作品信息失败 {work_dir.name}: {e}")
+            return None
+    
     def load_comments_from_work(self, work_dir: str) -> List[Dict]:
         """从指定作品目录加载评论数据
         
@@ -114,64 +284,73 @@ class LocalCommentLoader:
         Returns:
             评论数据列表
         """
+        return [record.as_dict() for record in self._load_comment_records(work_dir)]
+    
+    def _load_comment_records(self, work_dir: str) -> List[CommentRecord]:
+        """加载作品的评论记录（按作品目录缓存，已按时间从新到旧排序）
+        
+        Args:
+            work_dir: 作品目录路径
+            
+        Returns:
+            评论记录列表（与缓存共享，调用方不应修改）
+        """
         work_path = Path(work_dir)
-        if not work_path.exists():
+        try:
+            work_stat = os.stat(work_path)
+        except OSError:
             return []
         
-        comments = []
+        # 目录、作品信息和提取报告都没有变化时直接返回上次加载的结果
+        mtime = (work_stat.st_mtime_ns,
+                 file_mtime_ns(work_path / "作品信息.json"),
+                 file_mtime_ns(work_path / "提取报告.txt"))
+        cached = self._comments_cache.get(work_dir)
+        if cached and cached[0] == mtime:
+            return cached[1]
         
         # 遍历所有用户目录
-        for user_dir in work_path.iterdir():
-            if not user_dir.is_dir():
-                continue
-            
-            # 跳过特殊文件
-            if user_dir.name in ['作品信息.json', '提取报告.txt']:
-                continue
-            
-            # 读取评论数据
-            comment_data = self._load_single_comment(user_dir)
-            if comment_data:
-                comments.append(comment_data)
+        with os.scandir(work_path) as it:
+            user_dirs = [Path(entry.path) for entry in it if entry.is_dir(follow_symlinks=False)]
+        
+        if not user_dirs:
+            return []
+        
+        # 并发读取各用户目录的评论数据
+        with ThreadPoolExecutor(max_workers=min(SCAN_MAX_WORKERS, len(user_dirs))) as pool:
+            # 同一批评论共用一个加载时间
+            batch_ts = datetime.now().strftime("%H:%M:%S")
+            records = [record for record in pool.map(self._load_single_comment, user_dirs, repeat(batch_ts))
+                       if record]
         
         # 按时间排序（最新在前）
-        comments.sort(key=lambda x: x.get('create_time', 0), reverse=True)
+        records.sort(key=attrgetter('create_time'), reverse=True)
         
-        return comments
+        self._comments_cache[work_dir] = (mtime, records)
+        return records
     
-    def _load_single_comment(self, user_dir: Path) -> Optional[Dict]:
+    def _load_single_comment(self, user_dir: Path, timestamp: str) -> Optional[CommentRecord]:
         """加载单个评论数据
         
         Args:
             user_dir: 用户评论目录
+            timestamp: 加载时间（同一批评论共用）
             
         Returns:
-            评论数据字典
+            评论记录
         """
         try:
-            # 读取原始数据
-            raw_data_file = user_dir / "原始数据.json"
-            if not raw_data_file.exists():
-                return None
-            
-            with open(raw_data_file, 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
+            # 读取原始数据（不存在时由open抛出FileNotFoundError，省去一次stat）
+            raw_data = read_json_file(user_dir / "原始数据.json")
             
             # 提取基本信息
             user_info = raw_data.get('user_info', {})
             nickname = user_info.get('nickname', user_dir.name)
             content = raw_data.get('content', '')
-            create_time = raw_data.get('create_time', 0)
+            create_time = raw_data.get('create_time') or 0
             
             # 转换时间格式
-            if create_time:
-                try:
-                    # 转换毫秒时间戳为可读格式
-                    time_str = datetime.fromtimestamp(create_time / 1000).strftime('%Y-%m-%d %H:%M:%S')
-                except:
-                    time_str = str(create_time)
-            else:
-                time_str = '未知时间'
+            time_str = format_timestamp_ms(create_time) if create_time else '未知时间'
             
             # 提取图片URL
             image_urls = []
@@ -187,96 +366,114 @@ class LocalCommentLoader:
             
             # 查找已下载的图片
             downloaded_images = []
-            for file_path in user_dir.iterdir():
-                if file_path.is_file() and file_path.suffix.lower() in ['.jpg', '.jpeg', '.png', '.gif']:
-                    downloaded_images.append(str(file_path))
-            
-            # 构造评论数据（与现有格式兼容）
-            comment_data = {
-                'nickname': nickname,
-                'time': time_str,
-                'content': content,
-                'images': image_urls,
-                'downloaded_images': downloaded_images,
-                'comment_dir': str(user_dir),
-                'timestamp': datetime.now().strftime("%H:%M:%S"),
-                'create_time': create_time,
-                'user_info': user_info,
-                'raw_data': raw_data
-            }
+            with os.scandir(user_dir) as it:
+                for file_entry in it:
+                    if is_image_name(file_entry.name) and file_entry.is_file(follow_symlinks=False):
+                        downloaded_images.append(file_entry.path)
             
-            return comment_data
+            return CommentRecord(
+                nickname=nickname,
+                time=time_str,
+                content=content,
+                images=image_urls,
+                downloaded_images=downloaded_images,
+                comment_dir=str(user_dir),
+                timestamp=timestamp,
+                create_time=create_time
+            )
             
+        except FileNotFoundError:
+            # 没有原始数据的目录不是评论目录
+            return None
         except Exception as e:
             print(f"加载评论数据失败 {user_dir.name}: {e}")
             return None
     
-    def _count_comments_in_work(self, work_dir: Path) -> int:
-        """统计作品中的评论数量"""
-        count = 0
-        for user_dir in work_dir.iterdir():
-            if user_dir.is_dir() and (user_dir / "原始数据.json").exists():
-                count += 1
-        return count
+    def load_comment_raw(self, comment_dir: str) -> Optional[Dict]:
+        """按需读取单条评论的完整原始数据（评论列表中不再保留raw_data/user_info）
+        
+        Args:
+            comment_dir: 评论目录路径（即评论数据中的comment_dir）
+            
+        Returns:
+            原始数据字典，读取失败时返回None
+        """
+        try:
+            return read_json_file(os.path.join(comment_dir, "原始数据.json"))
+        except Exception as e:
+            print(f"读取原始数据失败 {comment_dir}: {e}")
+            return None
     
-    def _get_latest_comment_time(self, work_dir: Path) -> Optional[str]:
-        """获取作品中最新的评论时间"""
-        latest_time = None
+    def _scan_work_once(self, work_dir: Path) -> Tuple[int, int, Optional[str], bool]:
+        """一次遍历作品目录，同时统计评论数量、最新评论时间和是否包含图片
+        
+        Returns:
+            (评论数量, 最新评论时间戳（毫秒，无评论时为0）, 最新评论时间, 是否包含图片)
+        """
+        count = 0
         latest_timestamp = 0
+        has_images = False
         
-        for user_dir in work_dir.iterdir():
-            if not user_dir.is_dir():
-                continue
+        with os.scandir(work_dir) as it:
+            user_dirs = [entry.path for entry in it if entry.is_dir(follow_symlinks=False)]
+        
+        for user_dir in user_dirs:
+            raw_data_file = None
+            with os.scandir(user_dir) as files:
+                for entry in files:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    if entry.name == "原始数据.json":
+                        raw_data_file = entry.path
+                    elif not has_images and is_image_name(entry.name):
+                        has_images = True
             
-            raw_data_file = user_dir / "原始数据.json"
-            if not raw_data_file.exists():
+            if raw_data_file is None:
                 continue
+            count += 1
             
             try:
-                with open(raw_data_file, 'r', encoding='utf-8') as f:
-                    raw_data = json.load(f)
+                with open(raw_data_file, 'rb') as f:
+                    data = f.read()
                 
-                create_time = raw_data.get('create_time', 0)
+                # 正则取不到（例如时间不是整数）时才完整解析
+                match = CREATE_TIME_RE.search(data)
+                if match:
+                    create_time = int(match.group(1))
+                else:
+                    create_time = load_json_bytes(data).get('create_time', 0)
                 if create_time > latest_timestamp:
                     latest_timestamp = create_time
-                    try:
-                        latest_time = datetime.fromtimestamp(create_time / 1000).strftime('%Y-%m-%d %H:%M:%S')
-                    except:
-                        latest_time = str(create_time)
                         
             except Exception:
                 continue
         
-        return latest_time
-    
-    def _check_work_has_images(self, work_dir: Path) -> bool:
-        """检查作品是否包含图片"""
-        for user_dir in work_dir.iterdir():
-            if not user_dir.is_dir():
-                continue
-            
-            # 检查是否有图片文件
-            for file_path in user_dir.iterdir():
-                if file_path.is_file() and file_path.suffix.lower() in ['.jpg', '.jpeg', '.png', '.gif']:
-                    return True
+        # 只格式化最终的最新时间
+        latest_time = format_timestamp_ms(latest_timestamp) if latest_timestamp else None
         
-        return False
+        return count, latest_timestamp, latest_time, has_images
     
-    def get_work_statistics(self, work_dir: str) -> Dict:
+    def get_work_statistics(self, work_dir: str, records: Optional[List[CommentRecord]] = None) -> Dict:
         """获取作品统计信息
         
         Args:
             work_dir: 作品目录路径
+            records: 已加载的评论记录，提供时不再重新加载
             
         Returns:
             统计信息字典
         """
-        comments = self.load_comments_from_work(work_dir)
+        if records is None:
+            records = self._load_comment_records(work_dir)
         
-        total_comments = len(comments)
-        total_images = sum(len(comment.get('images', [])) for comment in comments)
-        comments_with_images = sum(1 for comment in comments if comment.get('downloaded_images'))
-        total_downloaded_images = sum(len(comment.get('downloaded_images', [])) for comment in comments)
+        # 一次遍历同时累计各项统计
+        total_comments = len(records)
+        total_images = comments_with_images = total_downloaded_images = 0
+        for record in records:
+            total_images += len(record.images)
+            if record.downloaded_images:
+                comments_with_images += 1
+                total_downloaded_images += len(record.downloaded_images)
         
         return {
             'total_comments': total_comments,
@@ -298,25 +495,25 @@ class LocalCommentLoader:
         Returns:
             筛选后的评论列表
         """
-        comments = self.load_comments_from_work(work_dir)
+        records = self._load_comment_records(work_dir)
         
         # 关键词搜索
         if search_term:
             search_term = search_term.lower()
-            comments = [
-                comment for comment in comments 
-                if (search_term in comment.get('content', '').lower() or 
-                    search_term in comment.get('nickname', '').lower())
+            records = [
+                record for record in records 
+                if (search_term in record.content_lower or 
+                    search_term in record.nickname_lower)
             ]
         
         # 筛选有图评论
         if show_images_only:
-            comments = [
-                comment for comment in comments 
-                if comment.get('downloaded_images') or comment.get('images')
+            records = [
+                record for record in records 
+                if record.downloaded_images or record.images
             ]
         
-        return comments
+        return [record.as_dict() for record in records]
     
     def export_work_summary(self, work_dir: str) -> str:
         """导出作品摘要信息
@@ -332,42 +529,30 @@ class LocalCommentLoader:
         # 读取作品信息
         work_info_file = work_path / "作品信息.json"
         try:
-            with open(work_info_file, 'r', encoding='utf-8') as f:
-                work_info = json.load(f)
+            work_info = read_json_file(work_info_file)
         except:
             work_info = {'作品标题': work_path.name}
         
-        # 获取统计信息
-        stats = self.get_work_statistics(work_dir)
-        comments = self.load_comments_from_work(work_dir)
+        # 获取统计信息（评论只加载一次）
+        records = self._load_comment_records(work_dir)
+        stats = self.get_work_statistics(work_dir, records)
         
         # 生成摘要
-        summary = f"""
-# {work_info.get('作品标题', '未知作品')} - 评论摘要
-
-## 基本信息
-- 作品ID: {work_info.get('作品ID', '未知')}
-- 提取时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-- 作品链接: {work_info.get('作品链接', '未知')}
-
-## 统计信息
-- 总评论数: {stats['total_comments']} 条
-- 有图评论: {stats['comments_with_images']} 条
-- 纯文本评论: {stats['comments_without_images']} 条
-- 总图片数: {stats['total_images']} 张
-- 已下载图片: {stats['total_downloaded_images']} 张
-
-## 最新评论预览
-"""
+        parts = [SUMMARY_HEADER_TEMPLATE.format(
+            title=work_info.get('作品标题', '未知作品'),
+            work_id=work_info.get('作品ID', '未知'),
+            extract_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            work_link=work_info.get('作品链接', '未知'),
+            **stats
+        )]
         
         # 添加最新3条评论
-        for i, comment in enumerate(comments[:3]):
-            summary += f"\n### {i+1}. {comment['nickname']} ({comment['time']})\n"
-            summary += f"{comment['content']}\n"
-            if comment.get('images'):
-                summary += f"📸 包含 {len(comment['images'])} 张图片\n"
+        for i, record in enumerate(records[:3]):
+            parts.append(f"\n### {i+1}. {record.nickname} ({record.time})\n{record.content}\n")
+            if record.images:
+                parts.append(f"📸 包含 {len(record.images)} 张图片\n")
         
-        if len(comments) > 3:
-            summary += f"\n... 还有 {len(comments) - 3} 条评论\n"
+        if len(records) > 3:
+            parts.append(f"\n... 还有 {len(records) - 3} 条评论\n")
         
-        return summary
\ No newline at end of file
+        return ''.join(parts)
\ No newline at end of file
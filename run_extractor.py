@@ -8,8 +8,30 @@
 import os
 import sys
 import subprocess
+from functools import lru_cache
 from pathlib import Path
 
+@lru_cache(maxsize=None)
+def resolve_venv_tools(venv_path: Path):
+    """解析虚拟环境中Python解释器和pip的路径（只解析一次）"""
+    if os.name == 'nt':  # Windows
+        bin_dir, suffix = venv_path / "Scripts", ".exe"
+    else:  # Unix/Linux/macOS
+        bin_dir, suffix = venv_path / "bin", ""
+    return os.fspath(bin_dir / f"python{suffix}"), os.fspath(bin_dir / f"pip{suffix}")
+
+def run_streamlit_in_process(script: Path, port: int) -> bool:
+    """在当前进程内启动Streamlit，省去再启动一个Python解释器的开销"""
+    try:
+        from streamlit.web import bootstrap
+    except ImportError:
+        return False
+    
+    flag_options = {'server.port': port, 'browser.gatherUsageStats': False}
+    bootstrap.load_config_options(flag_options=flag_options)
+    bootstrap.run(str(script), False, [], flag_options)
+    return True
+
 def main():
     """主函数"""
     print("🖼️ 小红书评论提取器 - 启动脚本")
@@ -36,14 +58,9 @@ def main():
             return 1
     
     # 确定Python解释器路径
-    if os.name == 'nt':  # Windows
-        python_path = venv_path / "Scripts" / "python.exe"
-        pip_path = venv_path / "Scripts" / "pip.exe"
-    else:  # Unix/Linux/macOS
-        python_path = venv_path / "bin" / "python"
-        pip_path = venv_path / "bin" / "pip"
+    python_path, pip_path = resolve_venv_tools(venv_path)
     
-    if not python_path.exists():
+    if not os.path.exists(python_path):
         print("❌ 错误：虚拟环境中的Python解释器不存在")
         return 1
     
@@ -53,7 +70,7 @@ def main():
     print("📦 检查依赖...")
     try:
         # 检查是否需要安装依赖
-        result = subprocess.run([str(python_path), "-c", 
+        result = subprocess.run([python_path, "-c", 
                                "import streamlit, playwright, aiohttp; print('依赖已安装')"],
                               capture_output=True, text=True)
         
@@ -61,21 +78,21 @@ def main():
             print("📦 安装依赖...")
             
             # 升级pip
-            subprocess.run([str(pip_path), "install", "--upgrade", "pip"], 
+            subprocess.run([pip_path, "install", "--upgrade", "pip"], 
                          check=True)
             
             # 安装requirements.txt
             requirements_file = project_root / "requirements.txt"
             if requirements_file.exists():
-                subprocess.run([str(pip_path), "install", "-r", "requirements.txt"], 
+                subprocess.run([pip_path, "install", "-r", "requirements.txt"], 
                              check=True)
             
             # 安装额外依赖
-            subprocess.run([str(pip_path), "install", "playwright", "aiohttp", "streamlit"], 
+            subprocess.run([pip_path, "install", "playwright", "aiohttp", "streamlit"], 
                          check=True)
             
             # 安装playwright浏览器
-            subprocess.run([str(python_path), "-m", "playwright", "install", "chromium"], 
+            subprocess.run([python_path, "-m", "playwright", "install", "chromium"], 
                          check=True)
             
             print("✅ 依赖安装完成")
@@ -101,19 +118,22 @@ def main():
             ui_file_fixed = project_root / "comment_extractor_ui_fixed.py"
             if ui_file_fixed.exists():
                 print("📱 使用修复版UI界面 (端口8502)")
-                subprocess.run([str(python_path), "-m", "streamlit", "run", 
-                               str(ui_file_fixed), "--server.port", "8502"])
+                # 已经运行在项目虚拟环境中时直接进程内启动，否则交给虚拟环境的解释器
+                in_venv = Path(sys.prefix).resolve() == venv_path.resolve()
+                if not (in_venv and run_streamlit_in_process(ui_file_fixed, 8502)):
+                    subprocess.run([python_path, "-m", "streamlit", "run", 
+                                   os.fspath(ui_file_fixed), "--server.port", "8502"])
             else:
-                subprocess.run([str(python_path), "start_ui.py"])
+                subprocess.run([python_path, "start_ui.py"])
             
         elif mode == "cli":
             print("⌨️ 运行命令行版本...")
             os.chdir(project_root)
-            subprocess.run([str(python_path), "dynamic_comment_extractor.py"])
+            subprocess.run([python_path, "dynamic_comment_extractor.py"])
             
         elif mode == "test":
             print("🧪 测试环境...")
-            result = subprocess.run([str(python_path), "-c", 
+            result = subprocess.run([python_path, "-c", 
                                    "import dynamic_comment_extractor; print('✅ 环境测试通过')"],
                                   cwd=project_root)
             return result.returncode